@@ -6,6 +6,8 @@ from openai import OpenAI
 from streamlit_folium import st_folium
 import data_loader
 import engine
+import quote_cache
+import geometry_memo
 import maps
 import os
 from pdf_generator import create_pdf
@@ -29,11 +31,36 @@ if "username" not in st.session_state: st.session_state.username = ""
 if "messages" not in st.session_state: st.session_state.messages = []
 if "inputs_cotizacion" not in st.session_state: st.session_state.inputs_cotizacion = None
 if "resultados" not in st.session_state: st.session_state.resultados = None
-if "hurdat_data" not in st.session_state: st.session_state.hurdat_data = data_loader.load_hurricane_data()
+if "geometry_cache" not in st.session_state: st.session_state.geometry_cache = {}
+
+# Datos vigentes: si el Excel de la temporada cambió, se actualizan solo los huracanes
+# nuevos o modificados y la caché geométrica de la sesión se lleva a la nueva versión.
+# TRACK_STORE_SHARED_DIR: almacén en archivos compartidos por todas las réplicas del host
+_dataset = data_loader.refresh_dataset(shared_dir=st.secrets.get("TRACK_STORE_SHARED_DIR", None))
+if "track_store" in st.session_state and st.session_state.track_store['version'] != _dataset['store']['version']:
+    _delta = _dataset['delta']
+    if _delta is not None and _delta['from_version'] == st.session_state.track_store['version']:
+        engine.update_circle_cache(st.session_state.geometry_cache, _dataset['store'], _delta)
+    else:
+        st.session_state.geometry_cache.clear()
+st.session_state.hurdat_data = _dataset['table']
+st.session_state.track_store = _dataset['store']
 
 # REEMPLAZA CON TU API KEY REAL O USA st.secrets
 client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"]) 
 
+# Caché de cotizaciones (LRU en memoria; disco opcional para sobrevivir reinicios)
+quote_cache.configure(
+    max_entries=int(st.secrets.get("QUOTE_CACHE_ENTRIES", 256)),
+    disk_dir=st.secrets.get("QUOTE_CACHE_DIR", None)
+)
+
+# Memo persistente de geometría por círculo (SQLite compartido entre sesiones y workers)
+GEOMETRY_MEMO_PATH = st.secrets.get("GEOMETRY_MEMO_PATH", None)
+if GEOMETRY_MEMO_PATH and "geometry_memo_ready" not in st.session_state:
+    geometry_memo.purge_other_datasets(GEOMETRY_MEMO_PATH, st.session_state.track_store['version'])
+    st.session_state.geometry_memo_ready = True
+
 # ==============================================================================
 # SYSTEM PROMPT (ACTUALIZADO CON REGLA DE AGRESIVO)
 # ==============================================================================
@@ -383,13 +410,16 @@ def main_app():
                                     df_pagos = pd.DataFrame(args['tabla_pagos'])
                                     
                                     # Ejecutar Engine
-                                    resultado = engine.run_engine_calculation(
-                                        st.session_state.hurdat_data,
+                                    resultado = quote_cache.cached_engine_calculation(
+                                        st.session_state.track_store,
                                         df_locs,
                                         df_pagos,
                                         float(args['limite_evento']),
                                         float(args['limite_agregado']),
-                                        float(args.get('factor_asimetrico', 0.5))
+                                        float(args.get('factor_asimetrico', 0.5)),
+                                        n_workers=int(st.secrets.get("ENGINE_WORKERS", 1)),
+                                        circle_cache=st.session_state.geometry_cache,
+                                        memo_path=GEOMETRY_MEMO_PATH
                                     )
                                     
                                     st.session_state.resultados = resultado
@@ -412,7 +442,7 @@ def main_app():
                                     if resultado['events']:
                                         detalle_historial = "\n\nDETALLE DE EVENTOS HISTÓRICOS (ÚSALO PARA EXPLICAR):"
                                         for ev in resultado['events']:
-                                            detalle_historial += f"\n- Año {ev['Year']} Huracán {ev['Name']}: Pago Final ${ev['PagoEventoAdj']:,.0f}. DETALLE TÉCNICO: {ev.get('breakdown_text', 'N/A')}"
+                                            detalle_historial += f"\n- Año {ev['Year']} Huracán {ev['Name']}: Pago Final ${ev['PagoEventoAdj']:,.0f}. DETALLE TÉCNICO: {engine.render_breakdown_text(ev)}"
                                     else:
                                         detalle_historial = "\n\nNo hubo eventos históricos con pago."
 
@@ -568,6 +598,13 @@ def main_app():
             except Exception as e:
                 st.error(f"Error PDF: {e}")
         
+        cache_info = quote_cache.cache_stats()
+        st.caption(f"Caché: {cache_info['hits'] + cache_info['disk_hits']} aciertos / {cache_info['misses']} fallos")
+        mem_total = _dataset['memory_report'].loc['Total']
+        st.caption(f"Trayectorias: {mem_total['Despues_MB']:.1f} MB (sin compactar: {mem_total['Antes_MB']:.1f} MB)")
+        with st.expander("Memoria por columna"):
+            st.dataframe(_dataset['memory_report'], use_container_width=True)
+        
         st.divider()
         if st.button("Cerrar Sesión"):
             st.session_state.clear() 
@@ -2,57 +2,345 @@ import pandas as pd
 import numpy as np
 import streamlit as st
 import os
+import threading
+import track_cache
+import shared_store
+from track_store import build_track_store, update_track_store
 
-@st.cache_resource
-def load_hurricane_data(txt_filepath="hurdat2-1851-2024-040425.txt", xlsx_filepath="best_tracks_atl_hu_2025.xlsx"):
+# Carpeta de la caché binaria de la tabla fusionada (None la desactiva)
+TRACK_CACHE_DIR = ".track_cache"
+
+# Campos de una línea de datos HURDAT2 (las de encabezado solo usan los 3 primeros)
+HURDAT2_FIELDS = [
+    'Date', 'Time', 'Record', 'Status', 'Lat', 'Lon', 'Wind_kt', 'Pressure',
+    'R34_NE', 'R34_SE', 'R34_SW', 'R34_NW',
+    'R50_NE', 'R50_SE', 'R50_SW', 'R50_NW',
+    'R64_NE', 'R64_SE', 'R64_SW', 'R64_NW',
+    'RMW',
+]
+# Presión y radios de viento: float32, -999 (faltante en HURDAT2) -> NaN
+HURDAT2_EXTRA_FIELDS = HURDAT2_FIELDS[7:]
+
+def _signed_coordinate(values, negative_suffix):
+    """
+    '28.0N' / '94.8W' -> float con signo, sin bucles en Python: los textos se
+    pasan a una matriz de caracteres, se lee y se borra el sufijo de cada fila
+    y el resto se convierte a número en numpy.
+    """
+    text = values.to_numpy(dtype=str)
+    width = text.dtype.itemsize // 4
+    chars = text.view(np.uint32).reshape(len(text), width).copy()
+    last = np.count_nonzero(chars, axis=1) - 1
+    rows = np.arange(len(text))
+    negative = chars[rows, last] == ord(negative_suffix)
+    chars[rows, last] = 0
+    number = chars.view(f'<U{width}').ravel().astype(np.float64)
+    return np.where(negative, -number, number)
+
+def _read_hurdat2_csv(txt_filepath, **kwargs):
+    """Lector CSV de pandas configurado para HURDAT2 (kwargs: p. ej. chunksize)."""
+    # +1: las líneas terminan en coma (campo final vacío).
+    # Texto solo en los 6 primeros campos; el resto se lee directo como número.
+    # skipinitialspace ya quita el relleno de espacios de cada campo.
+    return pd.read_csv(
+        txt_filepath, header=None, names=range(len(HURDAT2_FIELDS) + 1), index_col=False,
+        dtype={i: object for i in range(6)}, skipinitialspace=True, **kwargs
+    )
+
+def _hurdat2_points(raw, leading=None, years=None):
+    """
+    Filas de datos de un bloque de HURDAT2 ya tokenizado.
+    leading: (HID, nombre, año) del huracán cuyo encabezado quedó en el bloque
+    anterior (lectura por partes). years: (desde, hasta) para descartar huracanes
+    antes de convertir coordenadas.
+    Retorna (puntos, encabezado del último huracán del bloque).
+    """
+    # Encabezado: solo trae HID, nombre y nº de registros (campo 4 vacío)
+    is_header = raw[4].isna().to_numpy()
+    storm_pos = np.cumsum(is_header) - 1
+    headers = raw.loc[is_header, [0, 1]]
+    hids = headers[0].str.strip().to_numpy(dtype=object)
+    names = headers[1].str.strip().to_numpy(dtype=object)
+    storm_years = pd.to_numeric(headers[0].str.strip().str[4:8], errors='coerce').fillna(0).to_numpy(dtype=np.int64)
+    if leading is not None:
+        hids = np.concatenate([np.array([leading[0]], dtype=object), hids])
+        names = np.concatenate([np.array([leading[1]], dtype=object), names])
+        storm_years = np.concatenate([[leading[2]], storm_years]).astype(np.int64)
+        storm_pos = storm_pos + 1
+    last = (hids[-1], names[-1], int(storm_years[-1])) if len(hids) else leading
+
+    data = raw.loc[~is_header]
+    owner = storm_pos[~is_header]
+    if years is not None:
+        keep = (storm_years[owner] >= years[0]) & (storm_years[owner] <= years[1])
+        data, owner = data.loc[keep], owner[keep]
+
+    df = pd.DataFrame({
+        'HID': hids[owner],
+        'Name': names[owner],
+        'Year': storm_years[owner],
+        'Date': data[0].to_numpy(dtype=object),
+        'Time': data[1].to_numpy(dtype=object),
+        'Status': data[3].to_numpy(dtype=object),
+        'Lat': _signed_coordinate(data[4], 'S'),
+        'Lon': _signed_coordinate(data[5], 'W'),
+        'Wind_kt': pd.to_numeric(data[6], errors='coerce').fillna(0.0).to_numpy(dtype=np.float64),
+        'Record': data[2].fillna('').to_numpy(dtype=object),
+    })
+    for i, col in enumerate(HURDAT2_EXTRA_FIELDS, start=7):
+        extra = pd.to_numeric(data[i], errors='coerce').to_numpy(dtype=np.float32)
+        df[col] = np.where(extra == -999, np.float32(np.nan), extra)
+    return df, last
+
+def parse_hurdat2(txt_filepath):
+    """
+    Parser vectorizado del formato HURDAT2.
+    Las líneas de encabezado (HID, nombre, nº de registros) y de datos se leen
+    en una sola pasada del lector CSV de pandas y se separan con una máscara.
+    Retorna una fila por punto con las columnas de siempre (HID, Name, Year, Date,
+    Time, Status, Lat, Lon, Wind_kt) más Record, Pressure, radios de viento y RMW.
+    """
+    return _hurdat2_points(_read_hurdat2_csv(txt_filepath))[0]
+
+# Alias aceptados (en mayúsculas) para cada campo del Excel, en orden de preferencia
+EXCEL_ALIASES = {
+    'HID': ['HID', 'HURACANID'],
+    'Name': ['HNAME', 'NAME'],
+    'Year': ['YEAR'],
+    'Date': ['DATE'],
+    'Time': ['TIME_UTC', 'TIME'],
+    'Record': ['RECORD'],
+    'Status': ['STATUS'],
+    'Lat': ['LATITUDE', 'LAT'],
+    'Lon': ['LONGITUDE', 'LON'],
+    'Wind_kt': ['WINDSPEED_KT', 'WIND'],
+    'Pressure': ['PRESSURE_MB', 'PRESURE_MB', 'PRESSURE'],
+}
+EXCEL_REQUIRED = ['HID', 'Date', 'Lat', 'Lon', 'Wind_kt']
+
+def _resolve_aliases(columns):
+    """Campo interno -> columna del Excel (se resuelve una vez por archivo)."""
+    upper = {str(c).strip().upper(): c for c in columns}
+    resolved = {}
+    for field, aliases in EXCEL_ALIASES.items():
+        found = next((upper[a] for a in aliases if a in upper), None)
+        if found is not None:
+            resolved[field] = found
+    missing = [f for f in EXCEL_REQUIRED if f not in resolved]
+    if missing:
+        raise ValueError(f"Faltan columnas en el Excel: {', '.join(missing)}")
+    return resolved
+
+def _text_column(values, default):
+    """
+    Texto sin espacios; los enteros leídos como float (20250811.0) pierden el '.0'
+    y las celdas vacías toman el valor por defecto.
+    """
+    if pd.api.types.is_numeric_dtype(values):
+        values = pd.to_numeric(values, errors='coerce').astype('Int64')
+    text = values.astype(str).str.strip()
+    return text.where(values.notna().to_numpy(), default)
+
+def _normalize_dates(dates):
+    """
+    Fechas de 7 dígitos (el Excel pierde un cero) -> 'YYYYMMDD'.
+    '2025101' -> '20251001' (mes 10-12 con día de un dígito); '2025915' -> '20250915'.
+    """
+    dates = pd.Series(dates, dtype=object)
+    short = (dates.str.len() == 7).to_numpy()
+    if short.any():
+        d = dates[short]
+        month = pd.to_numeric(d.str[4:6], errors='coerce')
+        two_digit_month = ((month >= 10) & (month <= 12)).to_numpy()
+        dates[short] = np.where(two_digit_month, d.str[:6] + '0' + d.str[6], d.str[:4] + '0' + d.str[4:])
+    return dates.to_numpy(dtype=object)
+
+def _excel_coordinate(values, negative_suffix, suffixes):
+    """Coordenada numérica o texto con sufijo ('17.3N', '65.6W') -> float con signo."""
+    if pd.api.types.is_numeric_dtype(values):
+        return values.to_numpy(dtype=np.float64)
+    text = values.astype(str).str.strip().str.upper()
+    number = pd.to_numeric(text.str.rstrip(suffixes), errors='coerce').to_numpy(dtype=np.float64)
+    return np.where(text.str.endswith(negative_suffix).to_numpy(), -number, number)
+
+def parse_best_track_excel(xlsx_filepath):
+    """
+    Lee un Excel de best tracks (temporada reciente o pronóstico) con operaciones
+    por columna y lo entrega con el mismo esquema que parse_hurdat2.
+    El año sale del HID (AL052025 -> 2025), si no de la columna YEAR y si no de la
+    fecha; las filas sin año se descartan con aviso.
+    """
+    raw = pd.read_excel(xlsx_filepath)
+    cols = _resolve_aliases(raw.columns)
+    n = len(raw)
+
+    def text(field, default):
+        if field not in cols:
+            return np.full(n, default, dtype=object)
+        return _text_column(raw[cols[field]], default).to_numpy(dtype=object)
+
+    def number(field, dtype):
+        if field not in cols:
+            return np.full(n, np.nan, dtype=dtype)
+        return pd.to_numeric(raw[cols[field]], errors='coerce').to_numpy(dtype=dtype)
+
+    hid = text('HID', '')
+    date = _normalize_dates(text('Date', ''))
+
+    # Año: HID -> columna YEAR -> fecha (nunca un valor fijo)
+    year = pd.to_numeric(pd.Series(hid).str[4:8], errors='coerce').to_numpy(dtype=np.float64)
+    year = np.where(np.isnan(year), number('Year', np.float64), year)
+    year = np.where(np.isnan(year), pd.to_numeric(pd.Series(date).str[:4], errors='coerce').to_numpy(dtype=np.float64), year)
+
+    df = pd.DataFrame({
+        'HID': hid,
+        'Name': text('Name', 'UNKNOWN'),
+        'Year': year,
+        'Date': date,
+        'Time': pd.Series(text('Time', '0')).str.zfill(4).to_numpy(dtype=object),
+        'Status': text('Status', 'HU'),
+        'Lat': _excel_coordinate(raw[cols['Lat']], 'S', 'NS'),
+        'Lon': _excel_coordinate(raw[cols['Lon']], 'W', 'EW'),
+        'Wind_kt': np.nan_to_num(number('Wind_kt', np.float64)),
+        'Record': text('Record', ''),
+    })
+    pressure = number('Pressure', np.float32)
+    df['Pressure'] = np.where(pressure == -999, np.float32(np.nan), pressure)
+    for col in HURDAT2_EXTRA_FIELDS[1:]:
+        df[col] = np.full(n, np.nan, dtype=np.float32)
+
+    no_year = df['Year'].isna()
+    if no_year.any():
+        st.warning(f"{xlsx_filepath}: se descartan {int(no_year.sum())} filas sin año (HID, YEAR y DATE vacíos o inválidos).")
+        df = df[~no_year]
+    df['Year'] = df['Year'].astype(np.int64)
+    return df.reset_index(drop=True)
+
+# ==============================================================================
+# LECTURA EN STREAMING (UN HURACÁN A LA VEZ)
+# ==============================================================================
+# Cada huracán se entrega como dict de arrays compactos:
+#   'hid', 'name', 'year' y 'lat', 'lon', 'wind' (float64), 'time' (datetime64[m]),
+# con los puntos ordenados por tiempo y sin los de viento <= 0 (igual que la tabla).
+# Filtros empujados al lector:
+#   years: (desde, hasta), se aplica con el encabezado, antes de convertir coordenadas.
+#   bbox:  (lat_min, lat_max, lon_min, lon_max) o lista de cajas; se descartan los
+#          huracanes cuya caja envolvente no toca ninguna, antes de armar sus arrays.
+
+def _touches_boxes(lat_min, lat_max, lon_min, lon_max, bbox):
+    """Máscara de huracanes cuya caja envolvente toca alguna de las cajas."""
+    boxes = [bbox] if np.ndim(bbox[0]) == 0 else bbox
+    hit = np.zeros(len(lat_min), dtype=bool)
+    for b_lat_lo, b_lat_hi, b_lon_lo, b_lon_hi in boxes:
+        hit |= ~((lat_min > b_lat_hi) | (lat_max < b_lat_lo) | (lon_min > b_lon_hi) | (lon_max < b_lon_lo))
+    return hit
+
+def _storms_from_points(points, bbox=None):
+    """Agrupa puntos (formato de la tabla) por HID y entrega un dict por huracán."""
+    points = points[points['Wind_kt'] > 0]
+    if points.empty:
+        return
+    codes, uniques = pd.factorize(points['HID'], sort=False)
+    lat = points['Lat'].to_numpy(dtype=np.float64)
+    lon = points['Lon'].to_numpy(dtype=np.float64)
+
+    if bbox is not None:
+        grouped = np.argsort(codes, kind='stable')
+        counts = np.bincount(codes, minlength=len(uniques))
+        starts = np.cumsum(counts) - counts
+        keep = _touches_boxes(np.minimum.reduceat(lat[grouped], starts), np.maximum.reduceat(lat[grouped], starts),
+                              np.minimum.reduceat(lon[grouped], starts), np.maximum.reduceat(lon[grouped], starts), bbox)
+        rows = keep[codes]
+        if not rows.any():
+            return
+        points, codes, lat, lon = points[rows], codes[rows], lat[rows], lon[rows]
+
+    stamp = points['Date'].astype(str).str.strip() + points['Time'].astype(str).str.strip().str.zfill(4)
+    times = pd.to_datetime(stamp, format='%Y%m%d%H%M', errors='coerce').to_numpy().astype('datetime64[m]')
+    wind = points['Wind_kt'].to_numpy(dtype=np.float64)
+    names = points['Name'].to_numpy()
+    years = points['Year'].to_numpy()
+
+    # Por huracán (en orden de aparición) y dentro de cada uno por tiempo
+    order = np.lexsort((times.view(np.int64), codes))
+    bounds = np.flatnonzero(np.diff(codes[order])) + 1
+    for idx in np.split(order, bounds):
+        first = idx[0]
+        yield {
+            'hid': str(uniques[codes[first]]),
+            'name': str(names[first]),
+            'year': int(years[first]),
+            'lat': lat[idx], 'lon': lon[idx], 'wind': wind[idx], 'time': times[idx],
+        }
+
+def iter_hurdat2_storms(txt_filepath, bbox=None, years=None, chunk_lines=200_000):
+    """
+    Huracanes de un archivo HURDAT2 (histórico o catálogo sintético) leídos por
+    bloques de chunk_lines líneas: la memoria no depende del tamaño del archivo.
+    """
+    leading = None
+    pending = None
+    for raw in _read_hurdat2_csv(txt_filepath, chunksize=chunk_lines):
+        points, leading = _hurdat2_points(raw, leading, years)
+        if pending is not None:
+            points = pd.concat([pending, points], ignore_index=True)
+        # El último huracán del bloque puede continuar en el siguiente
+        tail = (points['HID'] == leading[0]).to_numpy() if leading is not None else np.zeros(len(points), dtype=bool)
+        pending = points[tail]
+        yield from _storms_from_points(points[~tail], bbox)
+    if pending is not None:
+        yield from _storms_from_points(pending, bbox)
+
+def iter_excel_storms(xlsx_filepath, bbox=None, years=None):
+    """Huracanes de un Excel de best tracks (se lee completo: son archivos chicos)."""
+    points = parse_best_track_excel(xlsx_filepath)
+    if years is not None:
+        points = points[(points['Year'] >= years[0]) & (points['Year'] <= years[1])]
+    yield from _storms_from_points(points, bbox)
+
+def iter_storms(txt_filepath="hurdat2-1851-2024-040425.txt", xlsx_filepath="best_tracks_atl_hu_2025.xlsx",
+                bbox=None, years=None, chunk_lines=200_000):
+    """
+    Huracanes de todas las fuentes, uno a la vez (primero HURDAT2, luego el Excel).
+    Cada fuente es la dueña de sus HID: no se fusionan trayectorias entre archivos.
+    """
+    if txt_filepath and os.path.exists(txt_filepath):
+        yield from iter_hurdat2_storms(txt_filepath, bbox, years, chunk_lines)
+    if xlsx_filepath and os.path.exists(xlsx_filepath):
+        yield from iter_excel_storms(xlsx_filepath, bbox, years)
+
+def load_hurricane_data(txt_filepath="hurdat2-1851-2024-040425.txt", xlsx_filepath="best_tracks_atl_hu_2025.xlsx",
+                        cache_dir=TRACK_CACHE_DIR):
     """
     Carga y combina datos históricos (TXT) con datos recientes (Excel).
+    Si hay una caché binaria vigente (track_cache) se lee de ahí sin parsear las fuentes.
+    No se cachea en memoria: _live_dataset conserva solo la versión compacta.
     """
-    data = []
-    
+    sources = [txt_filepath, xlsx_filepath]
+    if cache_dir:
+        cached = track_cache.read_cache(cache_dir, sources)
+        if cached is not None:
+            return cached
+
+    df_final, complete = build_hurricane_table(txt_filepath, xlsx_filepath)
+    if cache_dir and complete:
+        try:
+            track_cache.write_cache(cache_dir, sources, df_final)
+        except OSError as e:
+            print(f"Advertencia: no se pudo escribir la caché de trayectorias: {e}")
+    return df_final
+
+def build_hurricane_table(txt_filepath, xlsx_filepath):
+    """
+    Parsea y fusiona las fuentes. Retorna (tabla, completa); completa es False si
+    el Excel existía pero no se pudo leer (ese resultado no se guarda en caché).
+    """
+    complete = True
+
     # ---------------------------------------------------------
     # 1. CARGA DEL ARCHIVO DE TEXTO (HURDAT2)
     # ---------------------------------------------------------
-    if os.path.exists(txt_filepath):
-        with open(txt_filepath, 'r') as f:
-            lines = f.readlines()
-
-        current_hid = None
-        current_name = None
-        current_year = None
-        
-        for line in lines:
-            parts = line.split(',')
-            if len(parts) == 4:  # Header row
-                current_hid = parts[0].strip()
-                current_name = parts[1].strip()
-                try: current_year = int(current_hid[4:8])
-                except: current_year = 0
-            else:  # Data row
-                # Parseo básico
-                lat_str = parts[4].strip()
-                lon_str = parts[5].strip()
-                wind_str = parts[6].strip()
-                
-                lat = float(lat_str[:-1]) * (-1 if lat_str[-1] == 'S' else 1)
-                lon = float(lon_str[:-1]) * (-1 if lon_str[-1] == 'W' else 1)
-                
-                try: wind = float(wind_str)
-                except: wind = 0.0
-
-                data.append({
-                    'HID': current_hid,
-                    'Name': current_name,
-                    'Year': current_year,
-                    'Date': parts[0].strip(),
-                    'Time': parts[1].strip(),
-                    'Status': parts[3].strip(),
-                    'Lat': lat,
-                    'Lon': lon,
-                    'Wind_kt': wind
-                })
-    
-    df_txt = pd.DataFrame(data)
+    df_txt = parse_hurdat2(txt_filepath) if os.path.exists(txt_filepath) else pd.DataFrame()
 
     # ---------------------------------------------------------
     # 2. CARGA DEL ARCHIVO EXCEL (Datos Recientes/Proyectados)
@@ -60,86 +348,195 @@ def load_hurricane_data(txt_filepath="hurdat2-1851-2024-040425.txt", xlsx_filepa
     df_excel = pd.DataFrame()
     if os.path.exists(xlsx_filepath):
         try:
-            # Asumimos que el Excel tiene columnas similares a las usadas en R
-            # Mapeo de nombres típicos de NOAA a nuestro formato interno
-            raw_xl = pd.read_excel(xlsx_filepath)
-            
-            # Normalización de columnas (ajusta según tu Excel real si fallara)
-            # Buscamos columnas clave ignorando mayúsculas
-            raw_xl.columns = [c.upper() for c in raw_xl.columns]
-            
-            processed_xl = []
-            for _, row in raw_xl.iterrows():
-                # Extracción segura de datos
-                hid = row.get('HID', row.get('HURACANID', 'UNKNOWN'))
-                name = row.get('HNAME', row.get('NAME', 'UNKNOWN'))
-                
-                # Manejo de Lat/Lon (pueden venir como números negativos o strings con N/W)
-                lat_val = row.get('LATITUDE', row.get('LAT', 0))
-                lon_val = row.get('LONGITUDE', row.get('LON', 0))
-                
-                # Limpieza Latitud
-                if isinstance(lat_val, str):
-                    factor = -1 if 'S' in lat_val else 1
-                    lat = float(lat_val.replace('N','').replace('S','')) * factor
-                else:
-                    lat = float(lat_val)
-                    
-                # Limpieza Longitud
-                if isinstance(lon_val, str):
-                    factor = -1 if 'W' in lon_val else 1
-                    lon = float(lon_val.replace('E','').replace('W','')) * factor
-                else:
-                    lon = float(lon_val)
-
-                # Fecha y Hora
-                date_val = str(row.get('DATE', ''))
-                time_val = str(row.get('TIME_UTC', row.get('TIME', '0000'))).zfill(4)
-                
-                # Año
-                try: year = int(str(hid)[4:8])
-                except: year = row.get('YEAR', 2025)
-
-                processed_xl.append({
-                    'HID': hid,
-                    'Name': name,
-                    'Year': year,
-                    'Date': date_val,
-                    'Time': time_val,
-                    'Status': row.get('STATUS', 'HU'),
-                    'Lat': lat,
-                    'Lon': lon,
-                    'Wind_kt': float(row.get('WINDSPEED_KT', row.get('WIND', 0)))
-                })
-            
-            df_excel = pd.DataFrame(processed_xl)
-            
+            df_excel = parse_best_track_excel(xlsx_filepath)
         except Exception as e:
+            complete = False
             st.error(f"Error cargando Excel {xlsx_filepath}: {e}")
 
     # ---------------------------------------------------------
     # 3. FUSIÓN Y LIMPIEZA FINAL
     # ---------------------------------------------------------
     # Unir ambos DataFrames
+    # Origen de cada fila: el Excel suplementario se actualiza (y puede quitar huracanes) en caliente
+    if not df_txt.empty:
+        df_txt['Source'] = 'HURDAT2'
     if not df_excel.empty:
+        df_excel['Source'] = 'Excel'
         df_final = pd.concat([df_txt, df_excel], ignore_index=True)
     else:
         df_final = df_txt
         
     # Filtrar datos sin viento
     df_final = df_final[df_final['Wind_kt'] > 0].copy()
+    df_final['Category'] = assign_category(df_final['Wind_kt'])
     
-    # Asignar Categorías
+    return df_final, complete
+
+def assign_category(wind_kt):
+    """Categoría Saffir-Simpson (TD/TS/H1..H5) según el viento en nudos."""
+    wind_kt = np.asarray(wind_kt)
     conditions = [
-        (df_final['Wind_kt'] <= 33),
-        (df_final['Wind_kt'] <= 63),
-        (df_final['Wind_kt'] <= 82),
-        (df_final['Wind_kt'] <= 95),
-        (df_final['Wind_kt'] <= 113),
-        (df_final['Wind_kt'] <= 135),
-        (df_final['Wind_kt'] > 135)
+        (wind_kt <= 33),
+        (wind_kt <= 63),
+        (wind_kt <= 82),
+        (wind_kt <= 95),
+        (wind_kt <= 113),
+        (wind_kt <= 135),
+        (wind_kt > 135)
     ]
     choices = ['TD', 'TS', 'H1', 'H2', 'H3', 'H4', 'H5']
-    df_final['Category'] = np.select(conditions, choices, default='Unknown')
-    
-    return df_final
\ No newline at end of file
+    return np.select(conditions, choices, default='Unknown')
+
+# ==============================================================================
+# REPRESENTACIÓN COMPACTA DE LA TABLA
+# ==============================================================================
+# Texto repetido -> category, Date + Time -> un solo Timestamp (datetime64[s]),
+# coordenadas y viento -> float32 (los datos traen 1 decimal), Year -> int16.
+# El motor usa su propio almacén en float64 (track_store), construido antes de compactar.
+
+COMPACT_CATEGORICAL = ['HID', 'Name', 'Status', 'Category', 'Record', 'Source']
+COMPACT_FLOAT32 = ['Lat', 'Lon', 'Wind_kt']
+
+def compact_track_table(df):
+    """Versión compacta de la tabla de trayectorias (admite una tabla ya compacta)."""
+    out = df.copy()
+    if 'Date' in out.columns and 'Time' in out.columns:
+        stamp = out['Date'].astype(str).str.strip() + out['Time'].astype(str).str.strip().str.zfill(4)
+        timestamp = pd.to_datetime(stamp, format='%Y%m%d%H%M', errors='coerce').astype('datetime64[s]')
+        out.insert(out.columns.get_loc('Date'), 'Timestamp', timestamp)
+        out = out.drop(columns=['Date', 'Time'])
+    for col in COMPACT_CATEGORICAL:
+        if col in out.columns and not isinstance(out[col].dtype, pd.CategoricalDtype):
+            out[col] = out[col].astype('category')
+    for col in COMPACT_FLOAT32:
+        if col in out.columns:
+            out[col] = out[col].astype(np.float32)
+    if 'Year' in out.columns:
+        out['Year'] = out['Year'].astype(np.int16)
+    return out
+
+def memory_report(df_before, df_after):
+    """Memoria por columna (MB) antes y después de compactar, con fila de total."""
+    before = df_before.memory_usage(deep=True, index=False) / 1e6
+    after = df_after.memory_usage(deep=True, index=False) / 1e6
+    report = pd.DataFrame({'Antes_MB': before, 'Despues_MB': after}).fillna(0.0)
+    report.loc['Total'] = report.sum()
+    report['Ahorro_Pct'] = (100.0 * (1.0 - report['Despues_MB'] / report['Antes_MB'])).where(report['Antes_MB'] > 0)
+    return report.round(3)
+
+def _file_stamp(path):
+    """(tamaño, mtime) del archivo, o None si no existe."""
+    try:
+        info = os.stat(path)
+    except OSError:
+        return None
+    return (info.st_size, info.st_mtime_ns)
+
+def _shared_track_store(shared_dir, stamps, build):
+    """
+    Almacén publicado en shared_dir para estas fuentes (mismo tamaño y mtime);
+    si no hay, se construye con build(), se publica y se abre desde ahí.
+    """
+    current = shared_store.read_current(shared_dir)
+    if current is not None and current['sources'] == stamps:
+        try:
+            return shared_store.attach_store(os.path.join(shared_dir, current['version']))
+        except (OSError, ValueError, KeyError):
+            pass
+    return shared_store.attach_store(shared_store.publish_store(build(), shared_dir, sources=stamps))
+
+def supplement_hids(table):
+    """HID que la tabla tomó del Excel suplementario."""
+    if 'Source' not in table.columns:
+        return set()
+    return set(table.loc[table['Source'] == 'Excel', 'HID'].astype(str))
+
+@st.cache_resource
+def _live_dataset(txt_filepath, xlsx_filepath, shared_dir=None):
+    """
+    Estado compartido por todas las sesiones del proceso: tabla, almacén y último delta.
+    shared_dir: carpeta del almacén compartido entre procesos (shared_store); None = privado.
+    """
+    table = load_hurricane_data(txt_filepath, xlsx_filepath)
+    if shared_dir:
+        stamps = [list(_file_stamp(p) or ()) for p in (txt_filepath, xlsx_filepath)]
+        store = _shared_track_store(shared_dir, stamps, lambda: build_track_store(table))
+    else:
+        store = build_track_store(table)
+    compact = compact_track_table(table)
+    report = memory_report(table, compact)
+    # La tabla completa se libera al salir: solo queda residente la compacta
+    del table
+    return {
+        'table': compact,
+        'memory_report': report,
+        'store': store,
+        'shared_dir': shared_dir,
+        'xlsx_stamp': _file_stamp(xlsx_filepath),
+        'supplement_hids': supplement_hids(compact),
+        'delta': None,
+        'lock': threading.Lock(),
+    }
+
+def refresh_dataset(txt_filepath="hurdat2-1851-2024-040425.txt", xlsx_filepath="best_tracks_atl_hu_2025.xlsx",
+                    shared_dir=None):
+    """
+    Estado vigente de los datos. Si el Excel suplementario cambió desde la última
+    lectura, solo sus huracanes nuevos o modificados se actualizan en la tabla y
+    en el almacén (update_track_store), sin volver a parsear el HURDAT2.
+    Con shared_dir, el almacén vive en archivos compartidos entre procesos.
+    Retorna el dict compartido ('table' en versión compacta, 'memory_report', 'store', 'delta').
+    """
+    live = _live_dataset(txt_filepath, xlsx_filepath, shared_dir)
+    stamp = _file_stamp(xlsx_filepath)
+    if stamp == live['xlsx_stamp']:
+        return live
+
+    with live['lock']:
+        if stamp == live['xlsx_stamp']:
+            return live
+        try:
+            supplement = parse_best_track_excel(xlsx_filepath) if stamp else pd.DataFrame({'HID': [], 'Wind_kt': []})
+        except Exception as e:
+            st.error(f"Error actualizando desde {xlsx_filepath}: {e}")
+            return live
+        supplement = supplement[supplement['Wind_kt'] > 0]
+        current_hids = set(supplement['HID'])
+
+        # HID que estaban en el Excel anterior y ya no están
+        removed = live['supplement_hids'] - current_hids
+        store, delta = update_track_store(live['store'], supplement, removed_hids=removed)
+
+        if delta is not None:
+            table = live['table']
+            supplement = supplement.copy()
+            supplement['Category'] = assign_category(supplement['Wind_kt'])
+            supplement['Source'] = 'Excel'
+            replaced = set(store['hid'][delta['updated']]) | removed
+            added = compact_track_table(supplement[supplement['HID'].isin(replaced)])
+            live['table'] = compact_track_table(pd.concat([table[~table['HID'].isin(replaced)], added],
+                                                          ignore_index=True))
+            if live['shared_dir']:
+                stamps = [list(_file_stamp(p) or ()) for p in (txt_filepath, xlsx_filepath)]
+                store = _shared_track_store(live['shared_dir'], stamps, lambda: store)
+            live['store'] = store
+            live['delta'] = delta
+        live['xlsx_stamp'] = stamp
+        live['supplement_hids'] = current_hids
+    return live
+
+def load_track_store(txt_filepath="hurdat2-1851-2024-040425.txt", xlsx_filepath="best_tracks_atl_hu_2025.xlsx",
+                     shared_dir=None):
+    """
+    Almacén columnar de trayectorias (arrays contiguos + offsets por huracán)
+    para el motor. Se construye una sola vez por proceso y se actualiza de forma
+    incremental cuando cambia el Excel suplementario (refresh_dataset).
+    """
+    return refresh_dataset(txt_filepath, xlsx_filepath, shared_dir)['store']
+
+if __name__ == "__main__":
+    # Paso de build: regenera la caché binaria (p. ej. en el deploy, antes de arrancar la app)
+    table, complete = build_hurricane_table("hurdat2-1851-2024-040425.txt", "best_tracks_atl_hu_2025.xlsx")
+    if complete:
+        key = track_cache.write_cache(TRACK_CACHE_DIR, ["hurdat2-1851-2024-040425.txt", "best_tracks_atl_hu_2025.xlsx"], table)
+        print(f"Caché de trayectorias escrita en {TRACK_CACHE_DIR}/{key} ({len(table)} filas)")
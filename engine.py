@@ -1,6 +1,12 @@
 import pandas as pd
 import numpy as np
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from math import radians, cos, sin, atan2, sqrt, pi
+from track_store import build_track_store, build_store_from_storms, storm_slice, select_storms
+from spatial_index import query_segments, query_box
+import geometry_memo
+import shared_store
 
 # ==============================================================================
 # 1. FUNCIONES GEOMÉTRICAS
@@ -48,65 +54,392 @@ def solve_intersection_wind(p1, p2, c_lat, c_lon, radius_km):
                 winds.append(w_interp)
     return winds
 
-def get_max_wind_exact(group, c_lat, c_lon, radius_km):
-    max_w = 0.0
-    # 1. Puntos dentro
-    for idx, row in group.iterrows():
-        d = haversine_km(row['Lon'], row['Lat'], c_lon, c_lat)
-        if d <= radius_km:
-            if row['Wind_kt'] > max_w: max_w = row['Wind_kt']
-    
-    # 2. Intersecciones
-    for i in range(len(group) - 1):
-        p1 = group.iloc[i]
-        p2 = group.iloc[i+1]
-        
-        # Optimización espacial simple
-        rad_deg = (radius_km / 111.0) + 1.0
-        if (min(p1['Lat'], p2['Lat']) > c_lat + rad_deg) or \
-           (max(p1['Lat'], p2['Lat']) < c_lat - rad_deg) or \
-           (min(p1['Lon'], p2['Lon']) > c_lon + rad_deg) or \
-           (max(p1['Lon'], p2['Lon']) < c_lon - rad_deg):
-            continue
-
-        crossing_winds = solve_intersection_wind(p1, p2, c_lat, c_lon, radius_km)
-        for w in crossing_winds:
-            if w > max_w: max_w = w     
+def haversine_km_np(lon1, lat1, lon2, lat2):
+    """Versión vectorizada de haversine_km (acepta arrays con broadcasting)."""
+    R = 6371.0
+    dlat = np.radians(lat2 - lat1)
+    dlon = np.radians(lon2 - lon1)
+    a = np.sin(dlat / 2)**2 + np.cos(np.radians(lat1)) * np.cos(np.radians(lat2)) * np.sin(dlon / 2)**2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return R * c
+
+def solve_intersection_wind_np(lat1, lon1, w1, lat2, lon2, w2, c_lat, c_lon, radius_km):
+    """
+    Versión vectorizada de solve_intersection_wind.
+    Todos los argumentos se combinan con broadcasting (ej: segmentos x círculos).
+    Retorna el viento máximo interpolado en los cruces del segmento con el círculo
+    (0.0 donde no hay cruce).
+    """
+    mid_lat = np.radians((lat1 + lat2) / 2)
+    km_per_deg_lat = 111.32
+    km_per_deg_lon = 111.32 * np.cos(mid_lat)
+
+    dx = (lon2 - lon1) * km_per_deg_lon
+    dy = (lat2 - lat1) * km_per_deg_lat
+    cx = (c_lon - lon1) * km_per_deg_lon
+    cy = (c_lat - lat1) * km_per_deg_lat
+
+    A = dx**2 + dy**2
+    B = -2 * (cx * dx + cy * dy)
+    C_eq = (cx**2 + cy**2) - radius_km**2
+    delta = B**2 - 4*A*C_eq
+
+    valid = (A >= 1e-9) & (delta >= 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sqrt_delta = np.sqrt(np.where(valid, delta, 0.0))
+        A_safe = np.where(valid, A, 1.0)
+        t1 = (-B - sqrt_delta) / (2*A_safe)
+        t2 = (-B + sqrt_delta) / (2*A_safe)
+
+    max_w = np.zeros(np.broadcast(valid, w1, w2).shape)
+    for t in (t1, t2):
+        ok = valid & (t >= -1e-5) & (t <= 1.00001)
+        t_clamp = np.clip(t, 0.0, 1.0)
+        w_interp = w1 + t_clamp * (w2 - w1)
+        max_w = np.maximum(max_w, np.where(ok, w_interp, 0.0))
     return max_w
 
+def get_max_wind_vectorized(lats, lons, winds, c_lats, c_lons, radii_km):
+    """
+    Kernel vectorizado equivalente a get_max_wind_exact para varios círculos a la vez.
+    lats/lons/winds: trayectoria del huracán ordenada en el tiempo.
+    c_lats/c_lons/radii_km: centros y radios de los círculos.
+    Retorna un array (n_circulos,) con el viento máximo (kt) dentro de cada círculo.
+    """
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    winds = np.asarray(winds, dtype=float)
+    c_lats = np.atleast_1d(np.asarray(c_lats, dtype=float))
+    c_lons = np.atleast_1d(np.asarray(c_lons, dtype=float))
+    radii_km = np.atleast_1d(np.asarray(radii_km, dtype=float))
+
+    max_w = np.zeros(len(c_lats))
+    if len(lats) == 0:
+        return max_w
+
+    # 1. Puntos dentro (puntos x círculos)
+    d = haversine_km_np(lons[:, None], lats[:, None], c_lons[None, :], c_lats[None, :])
+    inside = d <= radii_km[None, :]
+    max_w = np.maximum(max_w, np.where(inside, winds[:, None], 0.0).max(axis=0))
+
+    if len(lats) < 2:
+        return max_w
+
+    # 2. Intersecciones (segmentos x círculos)
+    lat1, lat2 = lats[:-1, None], lats[1:, None]
+    lon1, lon2 = lons[:-1, None], lons[1:, None]
+    w1, w2 = winds[:-1, None], winds[1:, None]
+
+    # Optimización espacial simple (misma caja que la versión escalar)
+    rad_deg = (radii_km / 111.0) + 1.0
+    near = ~((np.minimum(lat1, lat2) > c_lats + rad_deg) |
+             (np.maximum(lat1, lat2) < c_lats - rad_deg) |
+             (np.minimum(lon1, lon2) > c_lons + rad_deg) |
+             (np.maximum(lon1, lon2) < c_lons - rad_deg))
+
+    crossing = solve_intersection_wind_np(lat1, lon1, w1, lat2, lon2, w2, c_lats, c_lons, radii_km)
+    max_w = np.maximum(max_w, np.where(near, crossing, 0.0).max(axis=0))
+    return max_w
+
+def get_crossing_wind_pairs(lat1, lon1, w1, lat2, lon2, w2, c_lat, c_lon, radius_km):
+    """Viento máximo (kt) en los cruces por par (segmento, círculo), con arrays planos alineados."""
+    rad_deg = (radius_km / 111.0) + 1.0
+    near = ~((np.minimum(lat1, lat2) > c_lat + rad_deg) |
+             (np.maximum(lat1, lat2) < c_lat - rad_deg) |
+             (np.minimum(lon1, lon2) > c_lon + rad_deg) |
+             (np.maximum(lon1, lon2) < c_lon - rad_deg))
+    crossing = solve_intersection_wind_np(lat1, lon1, w1, lat2, lon2, w2, c_lat, c_lon, radius_km)
+    return np.where(near, crossing, 0.0)
+
+def get_max_wind_pairs(lat1, lon1, w1, lat2, lon2, w2, c_lat, c_lon, radius_km):
+    """
+    Viento máximo (kt) por par (segmento, círculo), con arrays planos alineados.
+    Combina los extremos del segmento dentro del círculo y los cruces del segmento.
+    Reducido por huracán da el mismo resultado que get_max_wind_vectorized siempre
+    que se incluyan todos los segmentos candidatos del índice espacial.
+    """
+    max_w = np.zeros(len(c_lat))
+    for lat, lon, w in ((lat1, lon1, w1), (lat2, lon2, w2)):
+        inside = haversine_km_np(lon, lat, c_lon, c_lat) <= radius_km
+        max_w = np.maximum(max_w, np.where(inside, w, 0.0))
+    return np.maximum(max_w, get_crossing_wind_pairs(lat1, lon1, w1, lat2, lon2, w2, c_lat, c_lon, radius_km))
+
+def compute_crossing_matrix(store, c_lats, c_lons, radii):
+    """
+    Viento máximo (kt) en los cruces segmento-círculo por (huracán, círculo), usando
+    el índice espacial: cada círculo consulta solo los segmentos que pueden tocarlo.
+    Los puntos dentro del círculo se evalúan aparte (storm_geometry), junto con el lado.
+    Retorna (storm_ids, crossing_matrix[n_storms_relevantes, n_circulos], candidatos_por_circulo).
+    """
+    index = store['segments']
+    seg_lists = [query_segments(index, c_lats[j], c_lons[j], radii[j]) for j in range(len(c_lats))]
+    n_candidates = np.array([len(s) for s in seg_lists], dtype=np.int64)
+
+    seg_ids = np.concatenate(seg_lists) if seg_lists else np.zeros(0, dtype=np.int64)
+    circ_ids = np.repeat(np.arange(len(c_lats)), n_candidates)
+    if len(seg_ids) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, len(c_lats))), n_candidates
+
+    p = index['seg_start'][seg_ids]
+    lat, lon, wind = store['lat'], store['lon'], store['wind']
+    pair_winds = get_crossing_wind_pairs(lat[p], lon[p], wind[p], lat[p + 1], lon[p + 1], wind[p + 1],
+                                         c_lats[circ_ids], c_lons[circ_ids], radii[circ_ids])
+
+    storm_ids, storm_pos = np.unique(index['seg_storm'][seg_ids], return_inverse=True)
+    crossing_matrix = np.zeros((len(storm_ids), len(c_lats)))
+    np.maximum.at(crossing_matrix, (storm_pos, circ_ids), pair_winds)
+    return storm_ids, crossing_matrix, n_candidates
+
+def get_max_wind_exact(group, c_lat, c_lon, radius_km):
+    max_w = get_max_wind_vectorized(
+        group['Lat'].to_numpy(), group['Lon'].to_numpy(), group['Wind_kt'].to_numpy(),
+        [c_lat], [c_lon], [radius_km]
+    )
+    return float(max_w[0])
+
 def determine_side_exact_r_logic(group, c_lat, c_lon):
-    dists = []
-    for idx, row in group.iterrows():
-        d = haversine_km(row['Lon'], row['Lat'], c_lon, c_lat)
-        dists.append({'idx': idx, 'dist': d, 'lat': row['Lat'], 'lon': row['Lon']})
-    
-    dists.sort(key=lambda x: x['dist'])
-    if len(dists) < 2: return "DER"
+    lats, lons = group['Lat'].to_numpy(), group['Lon'].to_numpy()
+    dists = haversine_km_np(lons[:, None], lats[:, None], c_lon, c_lat)
+    izq = sides_from_distances(lats, lons, dists, np.array([c_lat]), np.array([c_lon]))
+    return "IZQ" if izq[0] else "DER"
+
+def sides_from_distances(lats, lons, dists, c_lats, c_lons):
+    """
+    Lado (True = IZQ) por centro, reutilizando la matriz de distancias (puntos x centros).
+    Usa los dos puntos más cercanos (dos pasadas de argmin, O(n)) en orden temporal y
+    el signo del producto cruz, igual que la lógica R. Ante distancias iguales gana el
+    punto de menor índice, como en el ordenamiento estable original:
+
+    >>> lats = np.array([0.0, 1.0, 0.0, -1.0]); lons = np.array([1.0, 0.0, -1.0, 0.0])
+    >>> d = np.ones((4, 1))   # cuatro puntos equidistantes: se toman el 0 y el 1
+    >>> bool(sides_from_distances(lats, lons, d, np.array([0.0]), np.array([0.0]))[0])
+    True
+    """
+    if len(lats) < 2:
+        return np.zeros(len(c_lats), dtype=bool)
     
-    p_close_A = dists[0]
-    p_close_B = dists[1]
+    cols = np.arange(dists.shape[1])
+    p_a = np.argmin(dists, axis=0)
+    rest = dists.copy()
+    rest[p_a, cols] = np.inf
+    p_b = np.argmin(rest, axis=0)
+    p_first, p_second = np.minimum(p_a, p_b), np.maximum(p_a, p_b)
     
-    if p_close_A['idx'] < p_close_B['idx']:
-        p_first, p_second = p_close_A, p_close_B
-    else:
-        p_first, p_second = p_close_B, p_close_A
-        
-    vec1_x = p_first['lon'] - c_lon
-    vec1_y = p_first['lat'] - c_lat
-    vec2_x = p_second['lon'] - c_lon
-    vec2_y = p_second['lat'] - c_lat
+    vec1_x = lons[p_first] - c_lons
+    vec1_y = lats[p_first] - c_lats
+    vec2_x = lons[p_second] - c_lons
+    vec2_y = lats[p_second] - c_lats
     
     cross_prod = (vec1_x * vec2_y) - (vec1_y * vec2_x)
-    return "IZQ" if cross_prod > 0 else "DER"
+    return cross_prod > 0
+
+def storm_geometry(lats, lons, winds, u_lats, u_lons, center_of_circle, radii, crossing_row):
+    """
+    Viento máximo por círculo y lado por centro de un huracán.
+    Las distancias huracán -> centro se calculan una sola vez y sirven tanto para
+    el test de puntos dentro del círculo como para el lado.
+    """
+    dists = haversine_km_np(lons[:, None], lats[:, None], u_lons[None, :], u_lats[None, :])
+    inside = dists[:, center_of_circle] <= radii[None, :]
+    inside_max = np.where(inside, winds[:, None], 0.0).max(axis=0)
+    return np.maximum(crossing_row, inside_max), sides_from_distances(lats, lons, dists, u_lats, u_lons)
+
+# ==============================================================================
+# 1.B PERFILES VIENTO-DISTANCIA (INDEPENDIENTES DEL RADIO)
+# ==============================================================================
+# Para un centro fijo, el viento máximo dentro de un radio r es una función
+# monótona de r. El perfil guarda, por huracán:
+#   - Escalones de puntos: distancias Haversine ordenadas + máximo acumulado.
+#   - Segmentos: rango [lo, hi] de distancias (planas) en que el círculo puede
+#     cortar el segmento; solo esos se evalúan con la cuadrática para un r dado.
+# Con el perfil, el viento para cualquier r <= max_radius_km sale de una búsqueda
+# binaria más unos pocos segmentos, sin volver a consultar el índice espacial.
+
+def _segmented_count_le(values, offsets, x):
+    """Búsqueda binaria vectorizada: cuántos valores <= x hay en cada tramo ordenado."""
+    lo = offsets[:-1].copy()
+    hi = offsets[1:].copy()
+    last = max(len(values) - 1, 0)
+    while True:
+        active = lo < hi
+        if not active.any():
+            break
+        mid = (lo + hi) // 2
+        go_right = active & (values[np.minimum(mid, last)] <= x)
+        lo = np.where(go_right, mid + 1, lo)
+        hi = np.where(active & ~go_right, mid, hi)
+    return lo - offsets[:-1]
+
+def build_wind_profile(store, c_lat, c_lon, max_radius_km):
+    """Perfil viento-distancia de todos los huracanes alrededor de un centro."""
+    index = store['segments']
+    segs = query_segments(index, c_lat, c_lon, max_radius_km)
+    p = index['seg_start'][segs]
+    lat, lon, wind = store['lat'], store['lon'], store['wind']
+    lat1, lon1, w1 = lat[p], lon[p], wind[p]
+    lat2, lon2, w2 = lat[p + 1], lon[p + 1], wind[p + 1]
+
+    # Rango de distancias planas (misma proyección que solve_intersection_wind)
+    km_per_deg_lon = 111.32 * np.cos(np.radians((lat1 + lat2) / 2))
+    dx = (lon2 - lon1) * km_per_deg_lon
+    dy = (lat2 - lat1) * 111.32
+    cx = (c_lon - lon1) * km_per_deg_lon
+    cy = (c_lat - lat1) * 111.32
+    A = dx**2 + dy**2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t_star = np.clip(np.where(A > 0, (cx * dx + cy * dy) / np.where(A > 0, A, 1.0), 0.0), 0.0, 1.0)
+    d_min = np.hypot(t_star * dx - cx, t_star * dy - cy)
+    d_max = np.maximum(np.hypot(cx, cy), np.hypot(dx - cx, dy - cy))
+    pad = 1.00001e-5 * np.sqrt(A) + 1e-9  # tolerancia de t en [-1e-5, 1.00001]
+    seg_lo, seg_hi = d_min - pad, d_max + pad
+    keep = seg_lo <= max_radius_km
+
+    # Puntos: extremos de los segmentos candidatos dentro del radio máximo
+    pts = np.unique(np.concatenate([p, p + 1]))
+    pt_dist = haversine_km_np(lon[pts], lat[pts], c_lon, c_lat)
+    pts, pt_dist = pts[pt_dist <= max_radius_km], pt_dist[pt_dist <= max_radius_km]
+    pt_storm = np.searchsorted(store['offsets'], pts, side='right') - 1
+
+    storm_ids = np.unique(index['seg_storm'][segs])
+    pt_pos = np.searchsorted(storm_ids, pt_storm)
+    order = np.lexsort((pt_dist, pt_pos))
+    pt_dist, pt_pos, pt_wind = pt_dist[order], pt_pos[order], wind[pts][order]
+    pt_offsets = np.zeros(len(storm_ids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(pt_pos, minlength=len(storm_ids)), out=pt_offsets[1:])
+    # Máximo acumulado dentro de cada huracán (escalones monótonos)
+    for k in range(len(storm_ids)):
+        s, e = pt_offsets[k], pt_offsets[k + 1]
+        pt_wind[s:e] = np.maximum.accumulate(pt_wind[s:e])
+
+    izq = np.zeros(len(storm_ids), dtype=bool)
+    for i, k in enumerate(storm_ids):
+        lats, lons, _ = storm_slice(store, k)
+        dists = haversine_km_np(lons[:, None], lats[:, None], c_lon, c_lat)
+        izq[i] = sides_from_distances(lats, lons, dists, np.array([c_lat]), np.array([c_lon]))[0]
+
+    return {
+        'lat': float(c_lat), 'lon': float(c_lon), 'max_radius_km': float(max_radius_km),
+        'storm_ids': storm_ids,
+        'izq': izq,
+        'pt_offsets': pt_offsets, 'pt_dist': pt_dist, 'pt_wind': pt_wind,
+        'seg_storm_pos': np.searchsorted(storm_ids, index['seg_storm'][segs][keep]),
+        'seg_lo': seg_lo[keep], 'seg_hi': seg_hi[keep],
+        'seg_lat1': lat1[keep], 'seg_lon1': lon1[keep], 'seg_w1': w1[keep],
+        'seg_lat2': lat2[keep], 'seg_lon2': lon2[keep], 'seg_w2': w2[keep],
+    }
+
+def build_wind_profiles(tracks, df_locations, max_radius_km=None):
+    """
+    Perfiles por centro único de df_locations, dict {(Lat, Lon): perfil}.
+    max_radius_km: radio máximo consultable (por defecto, el mayor radio de cada centro).
+    """
+    store = tracks if isinstance(tracks, dict) else build_track_store(tracks)
+    profiles = {}
+    for (c_lat, c_lon), grp in df_locations.groupby(['Lat', 'Lon'], sort=False):
+        r_max = grp['Radius'].max() if max_radius_km is None else max_radius_km
+        profiles[(c_lat, c_lon)] = build_wind_profile(store, float(c_lat), float(c_lon), float(r_max))
+    return profiles
+
+def profile_max_wind(profile, radius_km):
+    """Viento máximo (kt) por huracán del perfil (alineado con profile['storm_ids'])."""
+    if radius_km > profile['max_radius_km']:
+        raise ValueError(f"Radio {radius_km} km mayor al radio máximo del perfil ({profile['max_radius_km']} km).")
+
+    offsets = profile['pt_offsets']
+    count = _segmented_count_le(profile['pt_dist'], offsets, radius_km)
+    last = np.maximum(offsets[:-1] + count - 1, 0)
+    pt_wind = profile['pt_wind'] if len(profile['pt_wind']) else np.zeros(1)
+    max_w = np.where(count > 0, pt_wind[np.minimum(last, len(pt_wind) - 1)], 0.0)
+
+    # Solo los segmentos cuyo rango de distancias contiene al radio pueden cortarlo
+    active = np.flatnonzero((profile['seg_lo'] <= radius_km) & (profile['seg_hi'] >= radius_km))
+    if len(active):
+        winds = get_max_wind_pairs(
+            profile['seg_lat1'][active], profile['seg_lon1'][active], profile['seg_w1'][active],
+            profile['seg_lat2'][active], profile['seg_lon2'][active], profile['seg_w2'][active],
+            np.full(len(active), profile['lat']), np.full(len(active), profile['lon']),
+            np.full(len(active), float(radius_km))
+        )
+        np.maximum.at(max_w, profile['seg_storm_pos'][active], winds)
+    return max_w
 
 # ==============================================================================
 # 2. LÓGICA FINANCIERA (REPLICADA EXACTAMENTE DE R)
 # ==============================================================================
 
+# Ajuste de RoL Mínimo (Umbral 3.5% y Mínimo 2%)
+MIN_ROL = 0.02
+UMBRAL_AJUSTE_ROL = 0.035
+
+def adjust_min_rol(net_rol):
+    """
+    Suavizado del RoL bajo el umbral: entre 0 y 3.5% se comprime hacia el mínimo de 2%.
+    Acepta escalares o arrays (vectorizado).
+    """
+    factor_adj_rol = (UMBRAL_AJUSTE_ROL - MIN_ROL) / UMBRAL_AJUSTE_ROL
+    net_rol = np.asarray(net_rol, dtype=float)
+    return np.where(net_rol < UMBRAL_AJUSTE_ROL,
+                    UMBRAL_AJUSTE_ROL - factor_adj_rol * (UMBRAL_AJUSTE_ROL - net_rol), net_rol)
+
+# Escenarios (9 Casos Mutuamente Excluyentes) según los ratios de AAL
+#   caso: (divisor_base, divisor_agg, target = AAL últimos 25 años si True, si no AAL 1949+)
+# Caso 0: ningún caso aplica (ratios no numéricos), se usan los valores iniciales.
+ROL_CASES = {
+    0: (0.4, 0.525, False),
+    1: (0.475, 0.575, True),    # todos < -10%,  últimos 25 > +10%
+    2: (0.4, 0.575, False),     # todos < -10%,  últimos 25 en ±10%
+    3: (0.5, 0.6, False),       # todos < -10%,  últimos 25 < -10%
+    4: (0.45, 0.575, True),     # todos en ±10%, últimos 25 > +10%
+    5: (0.4, 0.55, False),      # todos en ±10%, últimos 25 en ±10%
+    6: (0.45, 0.6, False),      # todos en ±10%, últimos 25 < -10%
+    7: (0.425, 0.55, True),     # todos > +10%,  últimos 25 > +10%
+    8: (0.4, 0.525, False),     # todos > +10%,  últimos 25 en ±10%
+    9: (0.425, 0.575, False),   # todos > +10%,  últimos 25 < -10%
+}
+
+def rol_scenarios(expected_loss_all_years, expected_loss_1949_onwards, expected_loss_last25y, limit_agg):
+    """
+    Caso, AAL objetivo y RoL (Base y Agresivo, ya suavizados) a partir de las
+    tres ventanas de AAL. Vectorizado: acepta escalares o arrays (p. ej. bootstrap).
+    Retorna (caso, target_aal, net_rol_base, net_rol_agg).
+    """
+    aal_all = np.asarray(expected_loss_all_years, dtype=float)
+    aal_1949 = np.asarray(expected_loss_1949_onwards, dtype=float)
+    aal_25 = np.asarray(expected_loss_last25y, dtype=float)
+    aal_1949 = np.where(aal_1949 == 0, 0.001, aal_1949)
+    
+    # Ratios de comparación
+    ratio_aal_all_years = (aal_all / aal_1949) - 1
+    ratio_aal_last25y = (aal_25 / aal_1949) - 1
+    
+    all_low, all_mid, all_high = (ratio_aal_all_years < -0.1, np.abs(ratio_aal_all_years) <= 0.1,
+                                  ratio_aal_all_years > 0.1)
+    l25_low, l25_mid, l25_high = (ratio_aal_last25y < -0.1, np.abs(ratio_aal_last25y) <= 0.1,
+                                  ratio_aal_last25y > 0.1)
+    case = np.select(
+        [all_low & l25_high, all_low & l25_mid, all_low & l25_low,
+         all_mid & l25_high, all_mid & l25_mid, all_mid & l25_low,
+         all_high & l25_high, all_high & l25_mid, all_high & l25_low],
+        np.arange(1, 10), default=0
+    )
+    
+    table = np.array([ROL_CASES[c] for c in range(10)], dtype=float)
+    divisor_base, divisor_agg, use_last25 = table[case, 0], table[case, 1], table[case, 2] > 0
+    target_aal = np.where(use_last25, aal_25, aal_1949)
+    
+    # Cálculo crudo (límite agregado escalar o un array de candidatos)
+    limit_agg = np.asarray(limit_agg, dtype=float)
+    safe_limit = np.where(limit_agg > 0, limit_agg, 1.0)
+    net_rol_base = np.where(limit_agg > 0, (1/divisor_base) * (target_aal / safe_limit), 0.0)
+    net_rol_agg = np.where(limit_agg > 0, (1/divisor_agg) * (target_aal / safe_limit), 0.0)
+    
+    # Ajuste de RoL Mínimo (Base y Agresivo)
+    return case, target_aal, adjust_min_rol(net_rol_base), adjust_min_rol(net_rol_agg)
+
 def calculate_complex_rol_exact(df_annual_stats, limit_agg):
     """
     Replica EXACTAMENTE la lógica de 'engine_cycloneQ.R' (líneas ~980-1127).
-    Calcula escenarios Base y Agresivo basándose en ratios históricos.
+    Calcula escenarios Base y Agresivo basándose en ratios históricos (ver ROL_CASES).
     """
     if df_annual_stats.empty: 
         return 0.0, 0.0, 0.0, 0.0, 0.0 # Base_RoL, Base_Prima, AAL, Agg_RoL, Agg_Prima
@@ -120,100 +453,15 @@ def calculate_complex_rol_exact(df_annual_stats, limit_agg):
     # 1949 en adelante
     df_1949 = df_annual_stats[df_annual_stats['Year'] >= 1949]
     expected_loss_1949_onwards = df_1949['PagoAnual'].mean()
-    if expected_loss_1949_onwards == 0: expected_loss_1949_onwards = 0.001
     
     # Últimos 25 años
     df_25 = df_annual_stats[df_annual_stats['Year'] >= (last_year_analized - 25 + 1)]
     expected_loss_last25y = df_25['PagoAnual'].mean()
     
-    # Ratios de comparación
-    ratio_aal_all_years = (expected_loss_all_years / expected_loss_1949_onwards) - 1
-    ratio_aal_last25y = (expected_loss_last25y / expected_loss_1949_onwards) - 1
-    
-    # 2. Lógica de Escenarios (9 Casos Mutuamente Excluyentes)
-    # Inicialización
-    divisor_base = 0.4
-    divisor_agg = 0.525
-    target_aal = expected_loss_1949_onwards
-    
-    # Caso 1
-    if ratio_aal_all_years < -0.1 and ratio_aal_last25y > 0.1:
-        divisor_base = 0.475
-        divisor_agg = 0.575
-        target_aal = expected_loss_last25y
-        
-    # Caso 2
-    elif ratio_aal_all_years < -0.1 and abs(ratio_aal_last25y) <= 0.1:
-        divisor_base = 0.4
-        divisor_agg = 0.575
-        target_aal = expected_loss_1949_onwards
-        
-    # Caso 3
-    elif ratio_aal_all_years < -0.1 and ratio_aal_last25y < -0.1:
-        divisor_base = 0.5
-        divisor_agg = 0.6
-        target_aal = expected_loss_1949_onwards
-        
-    # Caso 4
-    elif abs(ratio_aal_all_years) <= 0.1 and ratio_aal_last25y > 0.1:
-        divisor_base = 0.45
-        divisor_agg = 0.575
-        target_aal = expected_loss_last25y
-        
-    # Caso 5
-    elif abs(ratio_aal_all_years) <= 0.1 and abs(ratio_aal_last25y) <= 0.1:
-        divisor_base = 0.4
-        divisor_agg = 0.55
-        target_aal = expected_loss_1949_onwards
-        
-    # Caso 6
-    elif abs(ratio_aal_all_years) <= 0.1 and ratio_aal_last25y < -0.1:
-        divisor_base = 0.45
-        divisor_agg = 0.6
-        target_aal = expected_loss_1949_onwards
-        
-    # Caso 7
-    elif ratio_aal_all_years > 0.1 and ratio_aal_last25y > 0.1:
-        divisor_base = 0.425
-        divisor_agg = 0.55
-        target_aal = expected_loss_last25y
-        
-    # Caso 8
-    elif ratio_aal_all_years > 0.1 and abs(ratio_aal_last25y) <= 0.1:
-        divisor_base = 0.4
-        divisor_agg = 0.525
-        target_aal = expected_loss_1949_onwards
-        
-    # Caso 9
-    elif ratio_aal_all_years > 0.1 and ratio_aal_last25y < -0.1:
-        divisor_base = 0.425
-        divisor_agg = 0.575
-        target_aal = expected_loss_1949_onwards
-
-    # 3. Ajuste de RoL Mínimo (Umbral 3.5% y Mínimo 2%)
-    min_rol = 0.02
-    umbra_ajuste_rol = 0.035
-    factor_adj_rol = (umbra_ajuste_rol - min_rol) / umbra_ajuste_rol
-    
-    # Cálculo crudo
-    if limit_agg > 0:
-        net_rol_base = (1/divisor_base) * (target_aal / limit_agg)
-        net_rol_agg = (1/divisor_agg) * (target_aal / limit_agg)
-    else:
-        net_rol_base = 0.0
-        net_rol_agg = 0.0
-    
-    # Ajuste Suavizado Base
-    if net_rol_base < umbra_ajuste_rol:
-        delta_rol = umbra_ajuste_rol - net_rol_base
-        delta_rol = factor_adj_rol * delta_rol
-        net_rol_base = umbra_ajuste_rol - delta_rol
-        
-    # Ajuste Suavizado Agresivo
-    if net_rol_agg < umbra_ajuste_rol:
-        delta_rol = umbra_ajuste_rol - net_rol_agg
-        delta_rol = factor_adj_rol * delta_rol
-        net_rol_agg = umbra_ajuste_rol - delta_rol
+    # 2. Escenario, AAL objetivo y RoL suavizado
+    _, target_aal, net_rol_base, net_rol_agg = rol_scenarios(
+        expected_loss_all_years, expected_loss_1949_onwards, expected_loss_last25y, limit_agg)
+    target_aal, net_rol_base, net_rol_agg = float(target_aal), float(net_rol_base), float(net_rol_agg)
         
     prima_base = net_rol_base * limit_agg
     prima_agg = net_rol_agg * limit_agg
@@ -221,168 +469,690 @@ def calculate_complex_rol_exact(df_annual_stats, limit_agg):
     return net_rol_base, prima_base, target_aal, net_rol_agg, prima_agg
 
 # ==============================================================================
-# 3. MOTOR PRINCIPAL
+# 2.B CURVAS DE EXCEDENCIA (AEP / OEP), PML Y TVaR
 # ==============================================================================
+# AEP: pérdida anual agregada; OEP: mayor pérdida de un solo evento en el año.
+# Curva empírica: pérdidas ordenadas de mayor a menor, la i-ésima (desde 1) tiene
+# probabilidad de excedencia i/n (periodo de retorno n/i).
+# PML a T años: cuantil 1 - 1/T de la pérdida anual (con pocos años, los periodos
+# largos caen sobre los mayores valores observados; usar el catálogo estocástico).
+# TVaR a T años: promedio de las pérdidas anuales >= PML.
+
+RETURN_PERIODS = (10, 25, 50, 100, 250)
+
+def exceedance_curve(losses):
+    """Curva empírica: dict con 'Perdida', 'Prob_Excedencia' y 'Periodo_Retorno' (arrays)."""
+    ordered = np.sort(np.asarray(losses, dtype=float))[::-1]
+    rank = np.arange(1, len(ordered) + 1)
+    return {
+        'Perdida': ordered,
+        'Prob_Excedencia': rank / max(len(ordered), 1),
+        'Periodo_Retorno': len(ordered) / rank,
+    }
 
-def run_engine_calculation(df_hurdat, df_locations, df_payouts, limit_event, limit_agg, asym_factor):
+def pml_tvar(losses, return_periods=RETURN_PERIODS):
+    """PML y TVaR por periodo de retorno, dicts {T: monto}."""
+    losses = np.asarray(losses, dtype=float)
+    if len(losses) == 0:
+        zero = {int(t): 0.0 for t in return_periods}
+        return zero, dict(zero)
+    levels = 1.0 - 1.0 / np.asarray(return_periods, dtype=float)
+    pml = np.quantile(losses, levels)
     
-    # 1. Filtro Espacial Preliminar
-    min_lat = df_locations['Lat'].min() - 5
-    max_lat = df_locations['Lat'].max() + 5
-    min_lon = df_locations['Lon'].min() - 5
-    max_lon = df_locations['Lon'].max() + 5
+    ordered = np.sort(losses)[::-1]
+    # Cuántas pérdidas >= PML (al menos una) y promedio de la cola con una suma acumulada
+    n_tail = np.maximum(len(ordered) - np.searchsorted(ordered[::-1], pml, side='left'), 1)
+    tvar = np.cumsum(ordered)[n_tail - 1] / n_tail
+    return ({int(t): float(v) for t, v in zip(return_periods, pml)},
+            {int(t): float(v) for t, v in zip(return_periods, tvar)})
+
+def exceedance_metrics(annual_losses, event_year_pos, event_losses, return_periods=RETURN_PERIODS):
+    """
+    Métricas de excedencia a partir de las series anual y por evento.
+    annual_losses: pérdida agregada por año (todos los años, incluidos los sin pago).
+    event_year_pos: posición (0..n_años-1) del año de cada evento; event_losses: pago del evento.
+    Retorna un dict listo para agregar a 'stats'.
+    """
+    annual_losses = np.asarray(annual_losses, dtype=float)
+    annual_max = np.zeros(len(annual_losses))
+    if len(event_losses):
+        np.maximum.at(annual_max, np.asarray(event_year_pos), np.asarray(event_losses, dtype=float))
     
-    relevant_hids = df_hurdat[
-        (df_hurdat['Lat'].between(min_lat, max_lat)) & 
-        (df_hurdat['Lon'].between(min_lon, max_lon))
-    ]['HID'].unique()
+    pml_aep, tvar_aep = pml_tvar(annual_losses, return_periods)
+    pml_oep, tvar_oep = pml_tvar(annual_max, return_periods)
+    return {
+        'PML_AEP': pml_aep, 'TVaR_AEP': tvar_aep,
+        'PML_OEP': pml_oep, 'TVaR_OEP': tvar_oep,
+        'Curva_AEP': exceedance_curve(annual_losses),
+        'Curva_OEP': exceedance_curve(annual_max),
+    }
+
+# ==============================================================================
+# 2.C BOOTSTRAP DE AAL, ESCENARIO Y RoL
+# ==============================================================================
+# Las tres ventanas de AAL están anidadas (todos ⊃ 1949+ ⊃ últimos 25), así que
+# se remuestrea por estratos disjuntos (hasta 1948, 1949 a 2000, últimos 25):
+# cada columna de una única matriz de índices (n_boot x n_años) sortea un año de
+# su propio estrato. Cada fila es un ciclo histórico alternativo con las mismas
+# ventanas; el escenario y el RoL salen de rol_scenarios sobre todas las filas.
+
+def bootstrap_rol(df_annual_stats, limit_agg, n_boot=2000, seed=0, level=0.90):
+    """
+    Bandas de confianza (percentiles, nivel level) por bootstrap de años.
+    Retorna un dict con (bajo, alto) para cada ventana de AAL, el AAL objetivo,
+    RoL y prima Base/Agresivo, más la frecuencia de cada caso (1-9) y el caso puntual.
+    """
+    last_year_analized = 2025
+    years = df_annual_stats['Year'].to_numpy()
+    losses = df_annual_stats['PagoAnual'].to_numpy(dtype=float)
+    stratum = np.where(years >= last_year_analized - 25 + 1, 2, np.where(years >= 1949, 1, 0))
     
-    df_subset = df_hurdat[df_hurdat['HID'].isin(relevant_hids)].copy()
-    grouped = df_subset.groupby('HID')
+    # Índices de cada estrato contiguos: inicio y tamaño por columna
+    order = np.argsort(stratum, kind='stable')
+    sizes = np.bincount(stratum, minlength=3)
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    rng = np.random.default_rng(seed)
+    draws = rng.integers(0, sizes[stratum[order]], size=(n_boot, len(order)))
+    sample = losses[order][starts[stratum[order]] + draws]
     
-    results_events = []
+    in_1949 = stratum[order] >= 1
+    in_25 = stratum[order] == 2
+    with np.errstate(invalid='ignore'):
+        aal_all = sample.mean(axis=1)
+        aal_1949 = sample[:, in_1949].mean(axis=1) if in_1949.any() else np.full(n_boot, np.nan)
+        aal_25 = sample[:, in_25].mean(axis=1) if in_25.any() else np.full(n_boot, np.nan)
+    case, target_aal, rol_base, rol_agg = rol_scenarios(aal_all, aal_1949, aal_25, limit_agg)
+    point_case = rol_scenarios(losses.mean(), losses[stratum >= 1].mean() if (stratum >= 1).any() else np.nan,
+                               losses[stratum == 2].mean() if (stratum == 2).any() else np.nan, limit_agg)[0]
     
-    # 2. Procesamiento Evento por Evento
-    for hid, group in grouped:
-        group = group.sort_values(['Date', 'Time']).reset_index(drop=True)
-        if len(group) < 2: continue
-        
-        circle_payouts = []
+    q = [(1 - level) / 2 * 100, (1 + level) / 2 * 100]
+    band = lambda values: tuple(float(v) for v in np.nanpercentile(values, q))
+    return {
+        'N_Boot': int(n_boot),
+        'Nivel': level,
+        'AAL_Todos': band(aal_all),
+        'AAL_1949': band(aal_1949),
+        'AAL_25': band(aal_25),
+        'AAL_Target': band(target_aal),
+        'Net_RoL': band(rol_base),
+        'RoL_Agresivo': band(rol_agg),
+        'Prima_Neta_Trad': band(rol_base * limit_agg),
+        'Prima_Agresiva': band(rol_agg * limit_agg),
+        'Caso': int(point_case),
+        'Frecuencia_Casos': {int(c): float(f) for c, f in enumerate(np.bincount(case, minlength=10) / n_boot) if f > 0},
+    }
+
+# ==============================================================================
+# 3. MOTOR PRINCIPAL
+# ==============================================================================
+# El cálculo se separa en dos etapas:
+#   a) Geometría (cara): viento máximo y lado por (huracán, círculo).
+#   b) Estructura financiera (barata): tabla de pagos, límites y asimetría.
+# Así una misma geometría sirve para muchas variantes de la cotización.
+
+_EXECUTORS = {}
+
+def _get_executor(kind, n_workers):
+    """Pool de workers reutilizable entre cotizaciones (se crea una vez por tipo y tamaño)."""
+    key = (kind, n_workers)
+    if key not in _EXECUTORS:
+        pool_cls = ThreadPoolExecutor if kind == 'thread' else ProcessPoolExecutor
+        _EXECUTORS[key] = pool_cls(max_workers=n_workers)
+    return _EXECUTORS[key]
+
+def _storm_geometry_batch(tracks, u_lats, u_lons, center_of_circle, radii):
+    """
+    Viento por círculo y lado por centro para un lote de huracanes.
+    tracks: lista de (lats, lons, winds, fila_de_cruces). Unidad de trabajo de los workers.
+    """
+    return [
+        storm_geometry(lats, lons, winds, u_lats, u_lons, center_of_circle, radii, crossing_row)
+        for lats, lons, winds, crossing_row in tracks
+    ]
+
+def _storm_geometry_shared(shared_path, storm_ids, crossing_rows, u_lats, u_lons, center_of_circle, radii):
+    """
+    Igual que _storm_geometry_batch, pero el worker lee las trayectorias del
+    almacén compartido (shared_store): solo viajan los ids y las filas de cruces.
+    """
+    store = shared_store.attach_store(shared_path)
+    tracks = [storm_slice(store, k) + (row,) for k, row in zip(storm_ids, crossing_rows)]
+    return _storm_geometry_batch(tracks, u_lats, u_lons, center_of_circle, radii)
+
+def _geometry_from_profiles(profiles, c_lats, c_lons, radii):
+    """Viento y lado por (huracán, círculo) a partir de perfiles viento-distancia."""
+    circle_profiles = []
+    for c_lat, c_lon in zip(c_lats, c_lons):
+        profile = profiles.get((c_lat, c_lon))
+        if profile is None:
+            raise ValueError(f"No hay perfil de viento para el centro ({c_lat}, {c_lon}).")
+        circle_profiles.append(profile)
+    
+    storm_ids = np.unique(np.concatenate(
+        [p['storm_ids'] for p in circle_profiles] + [np.zeros(0, dtype=np.int64)]
+    )).astype(np.int64)
+    wind_matrix = np.zeros((len(storm_ids), len(c_lats)))
+    izq_matrix = np.zeros((len(storm_ids), len(c_lats)), dtype=bool)
+    n_candidates = np.zeros(len(c_lats), dtype=np.int64)
+    for j, (profile, radius_km) in enumerate(zip(circle_profiles, radii)):
+        rows = np.searchsorted(storm_ids, profile['storm_ids'])
+        wind_matrix[rows, j] = profile_max_wind(profile, radius_km)
+        izq_matrix[rows, j] = profile['izq']
+        n_candidates[j] = len(profile['seg_lo'])
+    return storm_ids, wind_matrix, izq_matrix, n_candidates
+
+def _center_of_circle(c_lats, c_lons):
+    """Índice de ubicación (centro único, en orden de aparición) de cada círculo."""
+    centers = pd.DataFrame({'Lat': c_lats, 'Lon': c_lons})
+    return centers.groupby(['Lat', 'Lon'], sort=False).ngroup().to_numpy()
+
+def compute_event_geometry(tracks, df_locations, n_workers=1, executor='process', profiles=None):
+    """
+    Etapa geométrica: viento máximo (kt) y lado por (huracán, círculo).
+    tracks: almacén columnar (track_store) o el DataFrame de load_hurricane_data.
+    n_workers: workers para el cálculo del lado (1 = serial, None = todos los núcleos).
+    executor: 'process' o 'thread'.
+    profiles: perfiles de build_wind_profiles; si se entregan, el viento y el lado
+    salen de ellos (cambios de radio casi gratis).
+    """
+    store = tracks if isinstance(tracks, dict) else build_track_store(tracks)
+    df_locations = df_locations.reset_index(drop=True)
+    
+    c_lats = df_locations['Lat'].to_numpy(dtype=float)
+    c_lons = df_locations['Lon'].to_numpy(dtype=float)
+    radii = df_locations['Radius'].to_numpy(dtype=float)
+    
+    # Asimetría: el lado depende solo del centro, se calcula una vez por ubicación
+    center_of_circle = _center_of_circle(c_lats, c_lons)
+    
+    if profiles is not None:
+        storm_ids, wind_matrix, izq_matrix, n_candidates = _geometry_from_profiles(profiles, c_lats, c_lons, radii)
+    else:
+        # 1. Filtro Espacial (índice de segmentos) + cruces por (huracán, círculo)
+        storm_ids, crossing_matrix, n_candidates = compute_crossing_matrix(store, c_lats, c_lons, radii)
         
-        for idx, loc in df_locations.iterrows():
-            c_lat, c_lon = loc['Lat'], loc['Lon']
-            radius_km = loc['Radius']
-            loc_limit = loc['Limit']
-            loc_id = int(loc['ID'])
-            
-            # A) Viento exacto
-            max_wind_kt = get_max_wind_exact(group, c_lat, c_lon, radius_km)
-            if max_wind_kt == 0: continue
-            
-            # B) Asimetría
-            side = determine_side_exact_r_logic(group, c_lat, c_lon)
-            
-            # C) Payout %
-            max_wind_kmh = max_wind_kt * 1.852
-            
-            # Buscar porcentaje en tabla
-            col_name = f"C{loc_id}"
-            payout_pct = 0.0
-            
-            # La tabla de pagos debe interpretarse como tramos [min_speed, next_min_speed)
-            # Filtramos todas las filas donde min_speed <= viento registrado
-            matching_rows = df_payouts[df_payouts['min_speed'] <= max_wind_kmh]
-            if not matching_rows.empty:
-                # Tomamos la última fila que cumple la condición (el tramo más alto alcanzado)
-                if col_name in df_payouts.columns:
-                    raw_val = matching_rows.iloc[-1][col_name]
-                elif 'payout' in df_payouts.columns:
-                    raw_val = matching_rows.iloc[-1]['payout']
-                else: 
-                    raw_val = 0.0
-                
-                # Normalizar % si viene como 10 en lugar de 0.10
-                payout_pct = raw_val / 100.0 if raw_val > 1.0 else raw_val
-            
-            pay_t = payout_pct * loc_limit
-            # Aplicamos factor asimétrico solo si está a la Izquierda
-            pay_a = pay_t * (asym_factor if side == "IZQ" else 1.0)
-            
-            if max_wind_kmh > 30: 
-                circle_payouts.append({
-                    'Lat': c_lat, 'Lon': c_lon,
-                    'ID': loc_id,
-                    'Radius': radius_km,
-                    'Wind': max_wind_kmh,
-                    'Pct': payout_pct,
-                    'PayTrad': pay_t, 
-                    'PayAsym': pay_a # Aquí guardamos el valor asimétrico monetario, aunque el RoL luego se calcula sobre la estructura anual
-                })
+        # 2. Puntos dentro y lado, con una sola matriz de distancias por huracán
+        first_circle = np.unique(center_of_circle, return_index=True)[1]
+        u_lats, u_lons = c_lats[first_circle], c_lons[first_circle]
         
-        if not circle_payouts: continue
+        tasks = []
+        for row_k, k in enumerate(storm_ids):
+            lats, lons, winds = storm_slice(store, k)
+            tasks.append((lats, lons, winds, crossing_matrix[row_k]))
         
-        df_circles = pd.DataFrame(circle_payouts)
+        if n_workers is None:
+            n_workers = os.cpu_count() or 1
         
-        # 3. Agregación: Un pago por ubicación (el círculo que más paga)
-        df_circles = df_circles.sort_values('PayTrad', ascending=False)
-        df_loc_winners = df_circles.drop_duplicates(subset=['Lat', 'Lon'], keep='first')
+        if n_workers <= 1 or len(tasks) < 2:
+            per_storm = _storm_geometry_batch(tasks, u_lats, u_lons, center_of_circle, radii)
+        else:
+            # Reparto en lotes contiguos; el orden de los lotes se conserva al unir
+            n_batches = min(len(tasks), n_workers * 4)
+            bounds = np.linspace(0, len(tasks), n_batches + 1).astype(int)
+            pool = _get_executor(executor, n_workers)
+            if executor == 'process' and 'shared_path' in store:
+                # Almacén compartido: los workers lo abren por su cuenta (sin copiar trayectorias)
+                futures = [
+                    pool.submit(_storm_geometry_shared, store['shared_path'],
+                                storm_ids[bounds[b]:bounds[b + 1]], crossing_matrix[bounds[b]:bounds[b + 1]],
+                                u_lats, u_lons, center_of_circle, radii)
+                    for b in range(n_batches)
+                ]
+            else:
+                futures = [
+                    pool.submit(_storm_geometry_batch, tasks[bounds[b]:bounds[b + 1]],
+                                u_lats, u_lons, center_of_circle, radii)
+                    for b in range(n_batches)
+                ]
+            per_storm = [g for f in futures for g in f.result()]
         
-        event_payout_trad = df_loc_winners['PayTrad'].sum()
+        wind_matrix = np.array([w for w, _ in per_storm]).reshape(len(storm_ids), len(c_lats))
+        center_izq = np.array([s for _, s in per_storm], dtype=bool).reshape(len(storm_ids), len(u_lats))
+        izq_matrix = center_izq[:, center_of_circle]
+    
+    return {
+        'locations': df_locations,
+        'storm_ids': storm_ids,
+        'hid': store['hid'][storm_ids],
+        'name': store['name'][storm_ids],
+        'year': store['year'][storm_ids],
+        'wind_kt': wind_matrix,
+        'izq': izq_matrix,
+        'center_of_circle': center_of_circle,
+        'n_candidates': n_candidates,
+        'n_segments': int(len(store['segments']['seg_start'])),
+    }
+
+def compute_event_geometry_incremental(tracks, df_locations, circle_cache, max_circles=256,
+                                       n_workers=1, executor='process', memo_path=None):
+    """
+    Igual que compute_event_geometry, pero reutiliza entre llamadas (en una sesión)
+    el viento y el lado por huracán de cada círculo.
+    circle_cache: dict mutable que vive en la sesión, clave (versión, Lat, Lon, Radio).
+    Solo se recalcula la geometría de los círculos nuevos o con centro/radio cambiado;
+    si solo cambian límites o tabla de pagos, no se recalcula nada.
+    max_circles: máximo de círculos guardados (se descartan los menos usados).
+    memo_path: archivo SQLite de geometry_memo (compartido entre sesiones); se
+    consulta antes de calcular y se completa con los círculos calculados.
+    """
+    store = tracks if isinstance(tracks, dict) else build_track_store(tracks)
+    df_locations = df_locations.reset_index(drop=True)
+    
+    c_lats = df_locations['Lat'].to_numpy(dtype=float)
+    c_lons = df_locations['Lon'].to_numpy(dtype=float)
+    radii = df_locations['Radius'].to_numpy(dtype=float)
+    keys = [(store['version'], lat, lon, r) for lat, lon, r in zip(c_lats, c_lons, radii)]
+    
+    # 1. Geometría solo para los círculos que no están en la sesión
+    missing = list(dict.fromkeys(k for k in keys if k not in circle_cache))
+    
+    # 1.b Memo persistente: círculos ya calculados por otra sesión o usuario
+    if missing and memo_path:
+        memo_keys = {k: geometry_memo.memo_key(*k[1:]) for k in missing}
+        stored = geometry_memo.load_circles(memo_path, store['version'], memo_keys.values())
+        for key in missing:
+            entry = stored.get(memo_keys[key])
+            if entry is None:
+                continue
+            storm_ids = np.searchsorted(store['hid'], entry['hid']).astype(np.int64)
+            order = np.argsort(storm_ids, kind='stable')
+            circle_cache[key] = {
+                'storm_ids': storm_ids[order],
+                'wind_kt': entry['wind_kt'][order],
+                'izq': entry['izq'][order],
+                'n_candidates': entry['n_candidates'],
+            }
+        missing = [k for k in missing if k not in circle_cache]
+    
+    if missing:
+        first_row = [keys.index(k) for k in missing]
+        geo = compute_event_geometry(store, df_locations.iloc[first_row], n_workers=n_workers, executor=executor)
+        for col, key in enumerate(missing):
+            hit = geo['wind_kt'][:, col] > 0
+            circle_cache[key] = {
+                'storm_ids': geo['storm_ids'][hit],
+                'wind_kt': geo['wind_kt'][hit, col],
+                'izq': geo['izq'][hit, col],
+                'n_candidates': int(geo['n_candidates'][col]),
+            }
+        if memo_path:
+            geometry_memo.save_circles(memo_path, store['version'], {
+                geometry_memo.memo_key(*key[1:]): {
+                    'hid': store['hid'][circle_cache[key]['storm_ids']],
+                    'wind_kt': circle_cache[key]['wind_kt'],
+                    'izq': circle_cache[key]['izq'],
+                    'n_candidates': circle_cache[key]['n_candidates'],
+                }
+                for key in missing
+            })
+    
+    # Uso reciente: los círculos de esta cotización pasan al final del LRU
+    for key in dict.fromkeys(keys):
+        circle_cache[key] = circle_cache.pop(key)
+    while len(circle_cache) > max(max_circles, len(set(keys))):
+        circle_cache.pop(next(iter(circle_cache)))
+    
+    # 2. Ensamblar las matrices (huracán x círculo) de la cotización actual
+    entries = [circle_cache[k] for k in keys]
+    storm_ids = np.unique(np.concatenate(
+        [e['storm_ids'] for e in entries] + [np.zeros(0, dtype=np.int64)]
+    )).astype(np.int64)
+    wind_matrix = np.zeros((len(storm_ids), len(keys)))
+    izq_matrix = np.zeros((len(storm_ids), len(keys)), dtype=bool)
+    for j, e in enumerate(entries):
+        rows = np.searchsorted(storm_ids, e['storm_ids'])
+        wind_matrix[rows, j] = e['wind_kt']
+        izq_matrix[rows, j] = e['izq']
+    
+    return {
+        'locations': df_locations,
+        'storm_ids': storm_ids,
+        'hid': store['hid'][storm_ids],
+        'name': store['name'][storm_ids],
+        'year': store['year'][storm_ids],
+        'wind_kt': wind_matrix,
+        'izq': izq_matrix,
+        'center_of_circle': _center_of_circle(c_lats, c_lons),
+        'n_candidates': np.array([e['n_candidates'] for e in entries], dtype=np.int64),
+        'n_segments': int(len(store['segments']['seg_start'])),
+    }
+
+def _batched(iterable, size):
+    """Listas de hasta size elementos de un iterable."""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def circle_bboxes(df_locations):
+    """Cajas de consulta de los círculos: filtro bbox para data_loader.iter_storms."""
+    return [query_box(lat, lon, r) for lat, lon, r in
+            zip(df_locations['Lat'].astype(float), df_locations['Lon'].astype(float), df_locations['Radius'].astype(float))]
+
+def compute_event_geometry_streaming(storms, df_locations, chunk_storms=2000, n_workers=1, executor='process'):
+    """
+    Igual que compute_event_geometry, pero sobre un iterable de huracanes
+    (data_loader.iter_storms) procesado en bloques de chunk_storms: en memoria
+    solo hay un bloque y las filas (huracán) con viento en algún círculo.
+    """
+    df_locations = df_locations.reset_index(drop=True)
+    c_lats = df_locations['Lat'].to_numpy(dtype=float)
+    c_lons = df_locations['Lon'].to_numpy(dtype=float)
+    
+    parts = []
+    n_candidates = np.zeros(len(df_locations), dtype=np.int64)
+    n_segments = 0
+    for chunk in _batched(storms, chunk_storms):
+        geo = compute_event_geometry(build_store_from_storms(chunk), df_locations,
+                                     n_workers=n_workers, executor=executor)
+        n_candidates += geo['n_candidates']
+        n_segments += geo['n_segments']
+        hit = (geo['wind_kt'] > 0).any(axis=1)
+        parts.append({k: geo[k][hit] for k in ('hid', 'name', 'year', 'wind_kt', 'izq')})
+    
+    if parts:
+        merged = {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+    else:
+        merged = {'hid': np.zeros(0, dtype=object), 'name': np.zeros(0, dtype=object),
+                  'year': np.zeros(0, dtype=np.int32),
+                  'wind_kt': np.zeros((0, len(df_locations))),
+                  'izq': np.zeros((0, len(df_locations)), dtype=bool)}
+    # Mismo orden que el almacén completo (por HID)
+    order = np.argsort(merged['hid'], kind='stable')
+    merged = {k: v[order] for k, v in merged.items()}
+    
+    return dict(merged,
+                locations=df_locations,
+                storm_ids=np.arange(len(order), dtype=np.int64),
+                center_of_circle=_center_of_circle(c_lats, c_lons),
+                n_candidates=n_candidates,
+                n_segments=n_segments)
+
+def update_circle_cache(circle_cache, store, delta, n_workers=1, executor='process'):
+    """
+    Lleva la caché de círculos de la sesión a la nueva versión del almacén tras
+    una actualización incremental (track_store.update_track_store): se renumeran
+    los huracanes que no cambiaron y solo se calcula la geometría de los
+    actualizados. Las entradas de otras versiones se descartan.
+    """
+    carried = [k for k in circle_cache if k[0] == delta['from_version']]
+    old_entries = [circle_cache[k] for k in carried]
+    for k in list(circle_cache):
+        if k[0] != delta['to_version']:
+            circle_cache.pop(k)
+    if not carried:
+        return circle_cache
+
+    df_circles = pd.DataFrame([k[1:] for k in carried], columns=['Lat', 'Lon', 'Radius'])
+    geo = None
+    if len(delta['updated']):
+        geo = compute_event_geometry(select_storms(store, delta['updated']), df_circles,
+                                     n_workers=n_workers, executor=executor)
+    
+    for col, (key, e) in enumerate(zip(carried, old_entries)):
+        ids = delta['old_to_new'][e['storm_ids']]
+        keep = ids >= 0
+        storm_ids, wind_kt, izq = ids[keep], e['wind_kt'][keep], e['izq'][keep]
+        if geo is not None:
+            hit = geo['wind_kt'][:, col] > 0
+            storm_ids = np.concatenate([storm_ids, delta['updated'][geo['storm_ids'][hit]]])
+            wind_kt = np.concatenate([wind_kt, geo['wind_kt'][hit, col]])
+            izq = np.concatenate([izq, geo['izq'][hit, col]])
+        order = np.argsort(storm_ids, kind='stable')
+        circle_cache[(delta['to_version'],) + key[1:]] = {
+            'storm_ids': storm_ids[order],
+            'wind_kt': wind_kt[order],
+            'izq': izq[order],
+            'n_candidates': int(len(query_segments(store['segments'], *key[1:]))),
+        }
+    return circle_cache
+
+def compile_payout_table(df_payouts, circle_ids):
+    """
+    Compila la tabla de tramos una vez por cotización.
+    Retorna (umbrales ordenados en km/h, matriz tramo x círculo con el pago como fracción).
+    """
+    order = np.argsort(df_payouts['min_speed'].to_numpy(dtype=float), kind='stable')
+    thresholds = df_payouts['min_speed'].to_numpy(dtype=float)[order]
+    matrix = np.zeros((len(thresholds), len(circle_ids)))
+    
+    for j, loc_id in enumerate(circle_ids):
+        col_name = f"C{loc_id}"
+        if col_name in df_payouts.columns:
+            matrix[:, j] = df_payouts[col_name].fillna(0).to_numpy(dtype=float)[order]
+        elif 'payout' in df_payouts.columns:
+            matrix[:, j] = df_payouts['payout'].fillna(0).to_numpy(dtype=float)[order]
+    
+    # Normalizar % si viene como 10 en lugar de 0.10
+    matrix = np.where(matrix > 1.0, matrix / 100.0, matrix)
+    return thresholds, matrix
+
+def lookup_payout_pct(wind_kmh, thresholds, matrix):
+    """
+    % de pago (fracción) por (huracán, círculo). Tramos [min_speed, next_min_speed):
+    se toma el umbral más alto <= viento con una sola búsqueda binaria.
+    """
+    if len(thresholds) == 0:
+        return np.zeros(wind_kmh.shape)
+    tranche = np.searchsorted(thresholds, wind_kmh, side='right') - 1
+    cols = np.broadcast_to(np.arange(wind_kmh.shape[1]), wind_kmh.shape)
+    return np.where(tranche >= 0, matrix[np.maximum(tranche, 0), cols], 0.0)
+
+def location_payouts(pay_t, pay_a, qualifies, center_of_circle):
+    """
+    Un pago por ubicación: en cada evento gana el círculo que más paga.
+    pay_t/pay_a/qualifies: matrices (evento x círculo).
+    Retorna (pago tradicional, pago asimétrico, ganadores[evento x ubicación], -1 = sin ganador).
+    """
+    n_events = pay_t.shape[0]
+    event_payout_trad = np.zeros(n_events)
+    event_payout_asym = np.zeros(n_events)
+    winners = np.full((n_events, center_of_circle.max(initial=-1) + 1), -1)
+    rows = np.arange(n_events)
+    for u in range(winners.shape[1]):
+        cols = np.flatnonzero(center_of_circle == u)
+        # En empates gana el primer círculo de la ubicación (orden estable)
+        pay_u = np.where(qualifies[:, cols], pay_t[:, cols], -np.inf)
+        best = cols[np.argmax(pay_u, axis=1)]
+        has_winner = qualifies[:, cols].any(axis=1)
+        winners[:, u] = np.where(has_winner, best, -1)
+        event_payout_trad += np.where(has_winner, pay_t[rows, best], 0.0)
         # Nota: La lógica R usa el 'lado' del círculo ganador para la asimetría global del evento
         # Aquí sumamos la asimetría calculada individualmente por ubicación ganadora
-        event_payout_asym = df_loc_winners['PayAsym'].sum()
-        
-        # Evidencia textual para la IA
-        breakdown_parts = []
-        for _, row in df_loc_winners.iterrows():
-            if row['PayTrad'] > 0:
-                part = (f"[Ubicación Lat:{row['Lat']:.2f}/Lon:{row['Lon']:.2f}] "
-                        f"Ganó Círculo {int(row['ID'])} ({row['Radius']}km) "
-                        f"Viento {row['Wind']:.1f} km/h -> "
-                        f"Tramo {row['Pct']*100:.0f}% = ${row['PayTrad']:,.0f}")
-                breakdown_parts.append(part)
-            else:
-                part = (f"[Ubicación Lat:{row['Lat']:.2f}] Círculo {int(row['ID'])} "
-                        f"Viento {row['Wind']:.1f} km/h (Bajo Trigger)")
-                breakdown_parts.append(part)
+        event_payout_asym += np.where(has_winner, pay_a[rows, best], 0.0)
+    return event_payout_trad, event_payout_asym, winners
 
-        breakdown_text = " || ".join(breakdown_parts)
-        
-        # Tope por Evento
-        raw_total = event_payout_trad
-        event_payout_trad = min(event_payout_trad, limit_event)
-        event_payout_asym = min(event_payout_asym, limit_event) # El límite por evento también aplica al asimétrico
-        
-        if raw_total > limit_event:
-            breakdown_text += f" || [ALERTA] Tope Evento Aplicado (${raw_total:,.0f} -> ${limit_event:,.0f})."
-
-        if event_payout_trad > 0:
-            results_events.append({
-                'HuracanID': hid,
-                'Name': group['Name'].iloc[0],
-                'Year': group['Year'].iloc[0],
-                'PagoEventoRaw': event_payout_trad,
-                'PagoAsymRaw': event_payout_asym, # Guardamos el asimétrico crudo
-                'breakdown_text': breakdown_text
-            })
+def _event_winners(locations, winners, wind_kmh, pct, pay_t):
+    """
+    Círculos ganadores de un evento, ordenados por pago (igual que el motor R).
+    Cada ganador es una tupla (ID, Lat, Lon, Radio, Viento km/h, Pct, Pago).
+    """
+    ids = locations['ID'].to_numpy()
+    lats = locations['Lat'].to_numpy(dtype=float)
+    lons = locations['Lon'].to_numpy(dtype=float)
+    radii = locations['Radius'].to_numpy(dtype=float)
+    return [
+        (int(ids[j]), float(lats[j]), float(lons[j]), float(radii[j]),
+         float(wind_kmh[j]), float(pct[j]), float(pay_t[j]))
+        for j in sorted(winners, key=lambda j: -pay_t[j])
+    ]
 
-    # 4. Agregación Anual y Límites Agregados (Ciclo Histórico)
+def render_breakdown_text(event):
+    """
+    Evidencia textual para la IA, generada bajo demanda a partir de los
+    ganadores estructurados del evento ('Ganadores').
+    """
+    if 'Ganadores' not in event:
+        return event.get('breakdown_text', 'N/A')
+    
+    breakdown_parts = []
+    raw_total = 0.0
+    for loc_id, lat, lon, radius_km, wind_kmh, pct, pay_t in event['Ganadores']:
+        raw_total += pay_t
+        if pay_t > 0:
+            part = (f"[Ubicación Lat:{lat:.2f}/Lon:{lon:.2f}] "
+                    f"Ganó Círculo {loc_id} ({radius_km}km) "
+                    f"Viento {wind_kmh:.1f} km/h -> "
+                    f"Tramo {pct*100:.0f}% = ${pay_t:,.0f}")
+        else:
+            part = (f"[Ubicación Lat:{lat:.2f}] Círculo {loc_id} "
+                    f"Viento {wind_kmh:.1f} km/h (Bajo Trigger)")
+        breakdown_parts.append(part)
+    breakdown_text = " || ".join(breakdown_parts)
+    
+    # Capas de un programa: el tramo del evento empieza en la prioridad
+    attachment = event.get('Prioridad', 0.0)
+    if attachment > 0:
+        breakdown_text += (f" || [CAPA] Prioridad ${attachment:,.0f} descontada "
+                           f"(${raw_total:,.0f} -> ${max(raw_total - attachment, 0.0):,.0f}).")
+    if event.get('TopeEvento'):
+        breakdown_text += f" || [ALERTA] Tope Evento Aplicado (${raw_total - attachment:,.0f} -> ${event['PagoEventoRaw']:,.0f})."
+    if event.get('RecorteAgregado'):
+        breakdown_text += f" || [AGREGADO] Recorte anual a ${event['PagoEventoAdj']:,.0f}"
+    return breakdown_text
+
+def _spent_before(values, group_start):
+    """
+    Suma de los valores previos dentro de cada grupo (último eje), reiniciando en cada
+    grupo: misma aritmética que el acumulador por año del motor R, sin arrastrar el
+    redondeo de un cumsum global a los años siguientes.
+    """
+    starts = np.flatnonzero(group_start)
+    bounds = np.append(starts, values.shape[-1])
+    spent = np.zeros_like(values)
+    for a, b in zip(bounds[:-1], bounds[1:]):
+        np.cumsum(values[..., a:b - 1], axis=-1, out=spent[..., a + 1:b])
+    return spent
+
+def apply_annual_aggregate(years, raw_payouts, limit_agg, order_key=None):
+    """
+    Recorte por límite agregado anual (cumsum por año + clip).
+    Dentro de cada año los eventos se consumen en el orden de order_key
+    (por defecto, el orden recibido). Retorna el pago ajustado por evento.
+    """
+    years = np.asarray(years)
+    raw_payouts = np.asarray(raw_payouts, dtype=float)
+    if len(raw_payouts) == 0:
+        return np.zeros(0)
+    
+    order_key = np.arange(len(years)) if order_key is None else np.asarray(order_key)
+    order = np.lexsort((order_key, years))
+    raw_sorted = raw_payouts[order]
+    years_sorted = years[order]
+    
+    # Suma de pagos previos del mismo año (cumsum exclusivo por grupo)
+    group_start = np.concatenate([[True], years_sorted[1:] != years_sorted[:-1]])
+    spent_before = _spent_before(raw_sorted, group_start)
+    
+    pay_sorted = np.minimum(raw_sorted, np.maximum(0.0, limit_agg - spent_before))
+    pay = np.empty_like(pay_sorted)
+    pay[order] = pay_sorted
+    return pay
+
+def _apply_annual_aggregate(results_events, limit_agg):
+    """Aplica el límite agregado anual. Retorna (df_annual, df_res_final)."""
     last_year_analized = 2025
     all_years = pd.DataFrame({'Year': range(1851, last_year_analized + 1)})
     
     if not results_events:
         df_annual = all_years.copy()
         df_annual['PagoAnual'] = 0.0
-        df_res_final = pd.DataFrame()
+        return df_annual, pd.DataFrame()
+    
+    # Orden por HuracanID dentro de cada año (igual que el motor R)
+    df_res = pd.DataFrame(results_events).sort_values('HuracanID', kind='stable').reset_index(drop=True)
+    raw_t = df_res['PagoEventoRaw'].to_numpy(dtype=float)
+    pay_t = apply_annual_aggregate(df_res['Year'].to_numpy(), raw_t, limit_agg)
+    df_res['PagoEventoAdj'] = pay_t
+    df_res['RecorteAgregado'] = pay_t < raw_t
+
+    # Crear Dataframe Anual para Estadísticas
+    annual_sums = df_res.groupby('Year')[['PagoEventoAdj']].sum().reset_index()
+    annual_sums.columns = ['Year', 'PagoAnual']
+    df_annual = pd.merge(all_years, annual_sums, on='Year', how='left').fillna(0)
+    df_res_final = df_res[df_res['PagoEventoAdj'] > 0].copy()
+    return df_annual, df_res_final
+
+def raw_event_payouts(geometry, df_payouts, asym_factor, circle_limits=None):
+    """
+    Pagos por evento antes de topes (un pago por ubicación, sin límite por evento
+    ni agregado). circle_limits: dict opcional {ID: límite} que reemplaza 'Limit'.
+    Retorna dict con 'trad' y 'asym' por evento y el detalle por (evento, círculo)
+    ('wind_kmh', 'pct', 'pay_t', 'winners') para la evidencia de ganadores.
+    """
+    locations = geometry['locations']
+    circle_ids = locations['ID'].astype(int).to_numpy()
+    loc_limits = locations['Limit'].to_numpy(dtype=float)
+    if circle_limits:
+        loc_limits = np.array([float(circle_limits.get(i, lim)) for i, lim in zip(circle_ids, loc_limits)])
+    
+    # C) Payout % y montos por (huracán, círculo)
+    wind_kmh = geometry['wind_kt'] * 1.852
+    thresholds, payout_matrix = compile_payout_table(df_payouts, circle_ids)
+    pct = lookup_payout_pct(wind_kmh, thresholds, payout_matrix)
+    pay_t = pct * loc_limits[None, :]
+    # Aplicamos factor asimétrico solo si está a la Izquierda
+    pay_a = pay_t * np.where(geometry['izq'], asym_factor, 1.0)
+    qualifies = (geometry['wind_kt'] > 0) & (wind_kmh > 30)
+    
+    # 3. Agregación: Un pago por ubicación (el círculo que más paga)
+    trad, asym, winners = location_payouts(pay_t, pay_a, qualifies, geometry['center_of_circle'])
+    return {'trad': trad, 'asym': asym, 'wind_kmh': wind_kmh, 'pct': pct, 'pay_t': pay_t, 'winners': winners}
+
+def apply_financial_structure(geometry, df_payouts, limit_event, limit_agg, asym_factor, circle_limits=None,
+                              n_boot=0, boot_seed=0):
+    """
+    Etapa financiera sobre una geometría ya calculada (compute_event_geometry).
+    circle_limits: dict opcional {ID: límite} que reemplaza la columna 'Limit'.
+    n_boot: si es > 0, agrega a stats['Bootstrap'] las bandas de bootstrap_rol.
+    Retorna {'events', 'stats', 'diagnostics'} igual que run_engine_calculation.
+    """
+    locations = geometry['locations']
+    raw = raw_event_payouts(geometry, df_payouts, asym_factor, circle_limits)
+    event_payout_trad, event_payout_asym, winners = raw['trad'], raw['asym'], raw['winners']
+    wind_kmh, pct, pay_t = raw['wind_kmh'], raw['pct'], raw['pay_t']
+    
+    # Tope por Evento
+    raw_total = event_payout_trad
+    event_payout_trad = np.minimum(event_payout_trad, limit_event)
+    event_payout_asym = np.minimum(event_payout_asym, limit_event) # El límite por evento también aplica al asimétrico
+    
+    results_events = []
+    for i in np.flatnonzero(event_payout_trad > 0):
+        results_events.append({
+            'HuracanID': geometry['hid'][i],
+            'Name': geometry['name'][i],
+            'Year': int(geometry['year'][i]),
+            'PagoEventoRaw': event_payout_trad[i],
+            'PagoAsymRaw': event_payout_asym[i], # Guardamos el asimétrico crudo
+            'TopeEvento': bool(raw_total[i] > limit_event),
+            # El texto de evidencia se genera bajo demanda (render_breakdown_text)
+            'Ganadores': _event_winners(locations, winners[i][winners[i] >= 0], wind_kmh[i], pct[i], pay_t[i])
+        })
+    
+    # 4. Agregación Anual y Límites Agregados (Ciclo Histórico)
+    df_annual, df_res_final = _apply_annual_aggregate(results_events, limit_agg)
+
+    # 5. Estadísticas (Base y Agresivo), curvas de excedencia y bootstrap opcional
+    if df_res_final.empty:
+        event_years, event_losses = np.zeros(0, dtype=np.int64), np.zeros(0)
     else:
-        df_res = pd.DataFrame(results_events).sort_values('HuracanID')
-        df_res['PagoEventoAdj'] = 0.0
-        
-        # Aplicación del Límite Agregado Anual
-        for y in df_res['Year'].unique():
-            mask = df_res['Year'] == y
-            sub = df_res[mask]
-            cum_t = 0.0
-            
-            for idx in sub.index:
-                raw_t = df_res.at[idx, 'PagoEventoRaw']
-                left_t = max(0, limit_agg - cum_t)
-                pay_t = min(raw_t, left_t)
-                
-                if pay_t < raw_t:
-                    current_text = df_res.at[idx, 'breakdown_text']
-                    df_res.at[idx, 'breakdown_text'] = current_text + f" || [AGREGADO] Recorte anual a ${pay_t:,.0f}"
-                
-                df_res.at[idx, 'PagoEventoAdj'] = pay_t
-                cum_t += pay_t
-
-        # Crear Dataframe Anual para Estadísticas
-        annual_sums = df_res.groupby('Year')[['PagoEventoAdj']].sum().reset_index()
-        annual_sums.columns = ['Year', 'PagoAnual']
-        df_annual = pd.merge(all_years, annual_sums, on='Year', how='left').fillna(0)
-        df_res_final = df_res[df_res['PagoEventoAdj'] > 0].copy()
-
-    # 5. Cálculo de Estadísticas (Base y Agresivo)
+        event_years = df_res_final['Year'].to_numpy()
+        event_losses = df_res_final['PagoEventoAdj'].to_numpy(dtype=float)
+    stats = quote_stats(df_annual, limit_agg, event_years, event_losses, n_boot=n_boot, boot_seed=boot_seed)
+    
+    events_list = df_res_final.to_dict('records') if not df_res_final.empty else []
+    return {'events': events_list, 'stats': stats, 'diagnostics': _geometry_diagnostics(geometry)}
+
+def quote_stats(df_annual, limit_agg, event_years, event_losses, n_boot=0, boot_seed=0):
+    """
+    'stats' de una cotización a partir del pago anual (df_annual: Year, PagoAnual)
+    y de los pagos ajustados por evento con su año.
+    """
     rol_base, prima_base, aal_target, rol_agg, prima_agg = calculate_complex_rol_exact(df_annual, limit_agg)
     
     stats = {
@@ -397,6 +1167,515 @@ def run_engine_calculation(df_hurdat, df_locations, df_payouts, limit_event, lim
         'AAL_Target': aal_target
     }
     
-    events_list = df_res_final.to_dict('records') if not df_res_final.empty else []
+    # Curvas de excedencia sobre el ciclo histórico (pagos ya ajustados);
+    # solo eventos de años del ciclo (fuera de él tampoco entran en PagoAnual)
+    annual_years = df_annual['Year'].to_numpy()
+    event_years = np.asarray(event_years)
+    in_cycle = np.isin(event_years, annual_years)
+    event_pos = np.searchsorted(annual_years, event_years[in_cycle])
+    event_losses = np.asarray(event_losses, dtype=float)[in_cycle]
+    stats.update(exceedance_metrics(df_annual['PagoAnual'].to_numpy(dtype=float), event_pos, event_losses))
+    if n_boot > 0:
+        stats['Bootstrap'] = bootstrap_rol(df_annual, limit_agg, n_boot=n_boot, seed=boot_seed)
+    return stats
 
-    return {'events': events_list, 'stats': stats}
\ No newline at end of file
+def _geometry_diagnostics(geometry):
+    """Diagnóstico del índice espacial: segmentos candidatos por círculo."""
+    circle_ids = geometry['locations']['ID'].astype(int).to_numpy()
+    return {
+        'Segmentos_Totales': geometry['n_segments'],
+        'Segmentos_Candidatos': [
+            {'ID': int(loc_id), 'Candidatos': int(n)}
+            for loc_id, n in zip(circle_ids, geometry['n_candidates'])
+        ]
+    }
+
+def compute_quote_geometry(tracks, df_locations, n_workers=1, executor='process', circle_cache=None,
+                           memo_path=None, chunk_storms=2000):
+    """Geometría de una cotización por la vía que corresponda (streaming, incremental o completa)."""
+    if not isinstance(tracks, (dict, pd.DataFrame)):
+        return compute_event_geometry_streaming(tracks, df_locations, chunk_storms=chunk_storms,
+                                                n_workers=n_workers, executor=executor)
+    if circle_cache is not None or memo_path:
+        return compute_event_geometry_incremental(tracks, df_locations,
+                                                  circle_cache if circle_cache is not None else {},
+                                                  n_workers=n_workers, executor=executor,
+                                                  memo_path=memo_path)
+    return compute_event_geometry(tracks, df_locations, n_workers=n_workers, executor=executor)
+
+def run_engine_calculation(tracks, df_locations, df_payouts, limit_event, limit_agg, asym_factor,
+                           n_workers=1, executor='process', circle_cache=None, memo_path=None,
+                           chunk_storms=2000, n_boot=0, boot_seed=0):
+    """
+    tracks: almacén columnar de trayectorias (track_store.build_track_store) o,
+    por compatibilidad, el DataFrame de load_hurricane_data. Modo de baja memoria:
+    un iterable de huracanes (data_loader.iter_storms, idealmente con
+    bbox=circle_bboxes(df_locations)), procesado en bloques de chunk_storms.
+    n_workers: número de workers para la etapa geométrica (1 = serial,
+    None = todos los núcleos). executor: 'process' o 'thread'.
+    circle_cache: dict de sesión para recálculo incremental por círculo
+    (ver compute_event_geometry_incremental).
+    memo_path: memo persistente de geometría (geometry_memo), compartido entre sesiones.
+    n_boot/boot_seed: bandas de confianza por bootstrap (ver bootstrap_rol); 0 = sin bootstrap.
+    """
+    geometry = compute_quote_geometry(tracks, df_locations, n_workers=n_workers, executor=executor,
+                                      circle_cache=circle_cache, memo_path=memo_path, chunk_storms=chunk_storms)
+    return apply_financial_structure(geometry, df_payouts, limit_event, limit_agg, asym_factor,
+                                     n_boot=n_boot, boot_seed=boot_seed)
+
+def run_batch_calculation(tracks, df_locations, structures, n_workers=1, executor='process'):
+    """
+    Cotiza muchas variantes financieras sobre los mismos círculos.
+    La geometría se calcula una sola vez.
+    structures: lista de dicts con 'df_payouts', 'limit_event', 'limit_agg' y,
+    opcionalmente, 'asym_factor' (0.5 por defecto) y 'circle_limits' ({ID: límite}).
+    Retorna una lista de resultados ({'events', 'stats', 'diagnostics'}) en el mismo orden.
+    """
+    geometry = compute_event_geometry(tracks, df_locations, n_workers=n_workers, executor=executor)
+    return [
+        apply_financial_structure(
+            geometry, s['df_payouts'], s['limit_event'], s['limit_agg'],
+            s.get('asym_factor', 0.5), circle_limits=s.get('circle_limits')
+        )
+        for s in structures
+    ]
+
+def run_radius_sweep(tracks, df_locations, radii, df_payouts, limit_event, limit_agg, asym_factor):
+    """
+    Cotiza la misma estructura con distintos radios.
+    radii: lista de variantes; cada una es un radio (km) para todos los círculos
+    o un dict {ID: radio}. Los perfiles viento-distancia se construyen una vez
+    con el mayor radio pedido por centro.
+    Retorna una lista de resultados en el mismo orden.
+    """
+    store = tracks if isinstance(tracks, dict) else build_track_store(tracks)
+    variants = []
+    for r in radii:
+        df_var = df_locations.copy()
+        if isinstance(r, dict):
+            df_var['Radius'] = [float(r.get(int(i), rad)) for i, rad in zip(df_var['ID'], df_var['Radius'])]
+        else:
+            df_var['Radius'] = float(r)
+        variants.append(df_var)
+    
+    profiles = build_wind_profiles(store, pd.concat(variants, ignore_index=True))
+    results = []
+    for df_var in variants:
+        geometry = compute_event_geometry(store, df_var, profiles=profiles)
+        results.append(apply_financial_structure(geometry, df_payouts, limit_event, limit_agg, asym_factor))
+    return results
+
+# ==============================================================================
+# 4. CATÁLOGO ESTOCÁSTICO (TRAYECTORIAS HISTÓRICAS PERTURBADAS)
+# ==============================================================================
+# Cada año simulado es una temporada histórica remuestreada (o un número Poisson
+# de huracanes del período base) y cada huracán se perturba con:
+#   - Desplazamiento: la trayectoria completa se mueve unos km. Se sortea uno de
+#     n_offsets desplazamientos fijos; mover la trayectoria equivale a mover los
+#     círculos en sentido contrario, así la geometría se calcula una sola vez
+#     para todos los círculos desplazados (n_offsets x n_círculos).
+#   - Escala de intensidad: el viento se multiplica por un factor lognormal de
+#     media 1. El viento en los cruces se interpola linealmente, por lo que el
+#     viento máximo por círculo escala con el mismo factor.
+# El catálogo (año, huracán, desplazamiento, factor) es pequeño y se sortea
+# completo con una sola semilla: el resultado no depende del tamaño de bloque
+# ni del número de workers. Los pagos se calculan por bloques de años.
+
+# Divisores del catálogo: sin tendencia entre ventanas (Caso 5 de calculate_complex_rol_exact)
+CATALOGUE_DIVISOR_BASE, CATALOGUE_DIVISOR_AGG = ROL_CASES[5][:2]
+
+def simulate_catalogue(store, n_years=10000, seed=0, jitter_km=25.0, n_offsets=32,
+                       intensity_sd=0.1, frequency='season', base_years=(1949, 2025)):
+    """
+    Catálogo sintético reproducible sobre el almacén de trayectorias.
+    frequency: 'season' (temporadas históricas completas, remuestreadas con
+    reemplazo) o 'poisson' (número de huracanes Poisson con la media histórica,
+    sorteados del período base). base_years: años históricos (inclusive).
+    Retorna dict con arrays por evento 'sim_year', 'storm_id', 'offset', 'scale'
+    (ordenados por año simulado y HID), 'offsets_km' (n_offsets x [norte, este]) y 'n_years'.
+    """
+    rng = np.random.default_rng(seed)
+    years = store['year']
+    pool = np.flatnonzero((years >= base_years[0]) & (years <= base_years[1]))
+    n_seasons = base_years[1] - base_years[0] + 1
+    if len(pool) == 0 or n_seasons <= 0:
+        raise ValueError(f"No hay huracanes entre {base_years[0]} y {base_years[1]} para simular.")
+    
+    offsets_km = rng.normal(0.0, jitter_km, size=(n_offsets, 2))
+    
+    if frequency == 'season':
+        # Huracanes del período agrupados por temporada (estilo CSR, HID dentro del año)
+        pool = pool[np.argsort(years[pool], kind='stable')]
+        counts = np.bincount(years[pool] - base_years[0], minlength=n_seasons)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        picked = rng.integers(0, n_seasons, size=n_years)
+        n_per_year = counts[picked]
+        sim_year = np.repeat(np.arange(n_years), n_per_year)
+        first = np.repeat(np.cumsum(n_per_year) - n_per_year, n_per_year)
+        storm_id = pool[np.repeat(starts[picked], n_per_year) + np.arange(len(sim_year)) - first]
+    elif frequency == 'poisson':
+        n_per_year = rng.poisson(len(pool) / n_seasons, size=n_years)
+        sim_year = np.repeat(np.arange(n_years), n_per_year)
+        storm_id = pool[rng.integers(0, len(pool), size=len(sim_year))]
+    else:
+        raise ValueError(f"Frecuencia desconocida: {frequency!r} (use 'season' o 'poisson').")
+    
+    offset = rng.integers(0, n_offsets, size=len(sim_year))
+    scale = np.exp(rng.normal(-0.5 * intensity_sd**2, intensity_sd, size=len(sim_year)))
+    
+    # Orden por HuracanID dentro de cada año (igual que el ciclo histórico)
+    order = np.lexsort((storm_id, sim_year))
+    return {
+        'sim_year': sim_year[order],
+        'storm_id': storm_id[order],
+        'offset': offset[order],
+        'scale': scale[order],
+        'offsets_km': offsets_km,
+        'n_years': int(n_years),
+    }
+
+def shifted_locations(df_locations, offsets_km):
+    """
+    Círculos movidos en sentido contrario a cada desplazamiento: bloque k de
+    filas = df_locations con la trayectoria desplazada offsets_km[k] (norte, este).
+    """
+    df_locations = df_locations.reset_index(drop=True)
+    lat = df_locations['Lat'].to_numpy(dtype=float)
+    lon = df_locations['Lon'].to_numpy(dtype=float)
+    d_lat = offsets_km[:, [0]] / 111.32
+    d_lon = offsets_km[:, [1]] / (111.32 * np.cos(np.radians(lat)))[None, :]
+    
+    shifted = pd.concat([df_locations] * len(offsets_km), ignore_index=True)
+    shifted['Lat'] = (lat[None, :] - d_lat).ravel()
+    shifted['Lon'] = (lon[None, :] - d_lon).ravel()
+    return shifted
+
+def _catalogue_chunk(events, wind_cube, izq_cube, thresholds, payout_matrix, loc_limits,
+                     center_of_circle, limit_event, limit_agg, asym_factor):
+    """Pagos de un bloque de años del catálogo (misma lógica que apply_financial_structure)."""
+    row, offset, scale, sim_year = events
+    wind_kt = wind_cube[row, offset] * scale[:, None]
+    wind_kmh = wind_kt * 1.852
+    pct = lookup_payout_pct(wind_kmh, thresholds, payout_matrix)
+    pay_t = pct * loc_limits[None, :]
+    pay_a = pay_t * np.where(izq_cube[row, offset], asym_factor, 1.0)
+    qualifies = (wind_kt > 0) & (wind_kmh > 30)
+    
+    trad, asym, _ = location_payouts(pay_t, pay_a, qualifies, center_of_circle)
+    raw = np.minimum(trad, limit_event)
+    asym = np.minimum(asym, limit_event)
+    adj = apply_annual_aggregate(sim_year, raw, limit_agg)
+    return raw, asym, trad > limit_event, adj
+
+def run_catalogue_calculation(tracks, df_locations, df_payouts, limit_event, limit_agg, asym_factor,
+                              n_years=10000, seed=0, jitter_km=25.0, n_offsets=32, intensity_sd=0.1,
+                              frequency='season', base_years=(1949, 2025), chunk_years=2000,
+                              n_workers=1, executor='process'):
+    """
+    Modo catálogo: la misma estructura CIC de run_engine_calculation sobre
+    n_years años simulados (ver simulate_catalogue para los parámetros de la simulación).
+    chunk_years: años por bloque en el cálculo de pagos (acota la memoria).
+    n_workers/executor: workers de la etapa geométrica; los bloques de años se
+    reparten en hilos.
+    Retorna {'annual', 'events', 'stats', 'diagnostics'}; 'annual' y 'events'
+    son DataFrames ('events' solo con los eventos que pagan).
+    """
+    store = tracks if isinstance(tracks, dict) else build_track_store(tracks)
+    df_locations = df_locations.reset_index(drop=True)
+    n_circles = len(df_locations)
+    catalogue = simulate_catalogue(store, n_years=n_years, seed=seed, jitter_km=jitter_km,
+                                   n_offsets=n_offsets, intensity_sd=intensity_sd,
+                                   frequency=frequency, base_years=base_years)
+    
+    # 1. Geometría de todos los círculos desplazados, una sola vez
+    geometry = compute_event_geometry(store, shifted_locations(df_locations, catalogue['offsets_km']),
+                                      n_workers=n_workers, executor=executor)
+    wind_cube = geometry['wind_kt'].reshape(-1, n_offsets, n_circles)
+    izq_cube = geometry['izq'].reshape(-1, n_offsets, n_circles)
+    relevant = wind_cube.reshape(len(wind_cube), n_offsets * n_circles).max(axis=1, initial=0.0) > 0
+    wind_cube, izq_cube = wind_cube[relevant], izq_cube[relevant]
+    row_of_storm = np.full(len(store['hid']), -1, dtype=np.int64)
+    row_of_storm[geometry['storm_ids'][relevant]] = np.arange(relevant.sum())
+    
+    # Solo los eventos de huracanes que tocan algún círculo pueden pagar
+    row = row_of_storm[catalogue['storm_id']]
+    hit = np.flatnonzero(row >= 0)
+    row, sim_year = row[hit], catalogue['sim_year'][hit]
+    offset, scale = catalogue['offset'][hit], catalogue['scale'][hit]
+    
+    # 2. Pagos por bloques de años
+    circle_ids = df_locations['ID'].astype(int).to_numpy()
+    loc_limits = df_locations['Limit'].to_numpy(dtype=float)
+    thresholds, payout_matrix = compile_payout_table(df_payouts, circle_ids)
+    center_of_circle = _center_of_circle(df_locations['Lat'].to_numpy(dtype=float),
+                                         df_locations['Lon'].to_numpy(dtype=float))
+    bounds = np.searchsorted(sim_year, np.arange(0, n_years + chunk_years, chunk_years))
+    chunks = [slice(a, b) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+    args = (wind_cube, izq_cube, thresholds, payout_matrix, loc_limits, center_of_circle,
+            limit_event, limit_agg, asym_factor)
+    tasks = [((row[c], offset[c], scale[c], sim_year[c]),) + args for c in chunks]
+    
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    if n_workers <= 1 or len(tasks) < 2:
+        parts = [_catalogue_chunk(*t) for t in tasks]
+    else:
+        pool = _get_executor('thread', n_workers)
+        parts = [f.result() for f in [pool.submit(_catalogue_chunk, *t) for t in tasks]]
+    
+    empty = np.zeros(0)
+    raw = np.concatenate([p[0] for p in parts] + [empty])
+    asym = np.concatenate([p[1] for p in parts] + [empty])
+    capped = np.concatenate([p[2] for p in parts] + [np.zeros(0, dtype=bool)])
+    adj = np.concatenate([p[3] for p in parts] + [empty])
+    annual = np.bincount(sim_year, weights=adj, minlength=n_years)
+    
+    # 3. Estadísticas
+    target_aal = float(annual.mean()) if n_years else 0.0
+    if limit_agg > 0:
+        net_rol_base = (1 / CATALOGUE_DIVISOR_BASE) * (target_aal / limit_agg)
+        net_rol_agg = (1 / CATALOGUE_DIVISOR_AGG) * (target_aal / limit_agg)
+    else:
+        net_rol_base = net_rol_agg = 0.0
+    net_rol_base = float(adjust_min_rol(net_rol_base))
+    net_rol_agg = float(adjust_min_rol(net_rol_agg))
+    
+    stats = {
+        'Prima_Neta_Trad': net_rol_base * limit_agg,
+        'Net_RoL_Pct': f"{net_rol_base*100:.2f}%",
+        'Prima_Agresiva': net_rol_agg * limit_agg,
+        'RoL_Agresivo_Pct': f"{net_rol_agg*100:.2f}%",
+        'AAL_Target': target_aal,
+        'Anos_Simulados': int(n_years),
+        'Eventos_Simulados': int(len(catalogue['sim_year'])),
+        'Prob_Pago_Anual': float((annual > 0).mean()) if n_years else 0.0,
+    }
+    paid = adj > 0
+    stats.update(exceedance_metrics(annual, sim_year[paid], adj[paid]))
+    
+    pos = geometry['storm_ids'][relevant][row[paid]]
+    events = pd.DataFrame({
+        'AnoSimulado': sim_year[paid],
+        'HuracanID': store['hid'][pos],
+        'Name': store['name'][pos],
+        'Year': store['year'][pos],
+        'DesvioNorte_km': catalogue['offsets_km'][offset[paid], 0],
+        'DesvioEste_km': catalogue['offsets_km'][offset[paid], 1],
+        'FactorViento': scale[paid],
+        'PagoEventoRaw': raw[paid],
+        'PagoAsymRaw': asym[paid],
+        'TopeEvento': capped[paid],
+        'PagoEventoAdj': adj[paid],
+        'RecorteAgregado': adj[paid] < raw[paid],
+    })
+    
+    diagnostics = {
+        'Semilla': seed,
+        'Desplazamientos': int(n_offsets),
+        'Huracanes_Relevantes': int(relevant.sum()),
+        'Eventos_Evaluados': int(len(hit)),
+        'Bloques': len(chunks),
+    }
+    return {
+        'annual': pd.DataFrame({'AnoSimulado': np.arange(n_years), 'PagoAnual': annual}),
+        'events': events,
+        'stats': stats,
+        'diagnostics': diagnostics,
+    }
+
+# ==============================================================================
+# 5. OPTIMIZADOR DE LÍMITES (CURVA PRIMA / RoL)
+# ==============================================================================
+# Los pagos por evento antes de topes dependen solo de la geometría, la tabla de
+# pagos y los límites por círculo. Con ellos guardados, cada par candidato
+# (limit_event, limit_agg) es: tope por evento, recorte agregado anual (cumsum
+# agrupado por año), AAL por ventana y rol_scenarios (con el suavizado del RoL
+# mínimo), todo vectorizado sobre la matriz (candidatos x eventos).
+
+def _paid_event_order(geometry, raw_trad):
+    """Filas de la geometría con pago, en el orden del ciclo histórico (año y HuracanID)."""
+    paid = np.flatnonzero(raw_trad > 0)
+    return paid[np.lexsort((geometry['hid'][paid].astype(str), geometry['year'][paid]))]
+
+def event_loss_table(geometry, df_payouts, asym_factor=0.5, circle_limits=None):
+    """
+    Pagos por evento antes de topes, solo eventos con pago, en el orden del ciclo
+    histórico (año y HuracanID). Retorna dict con 'hid', 'year' y 'raw'.
+    """
+    raw = raw_event_payouts(geometry, df_payouts, asym_factor, circle_limits)['trad']
+    order = _paid_event_order(geometry, raw)
+    return {'hid': geometry['hid'][order], 'year': geometry['year'][order].astype(np.int64), 'raw': raw[order]}
+
+HISTORICAL_YEARS = np.arange(1851, 2025 + 1)
+
+def aggregate_rows(years, capped, limit_aggs):
+    """
+    Recorte agregado anual sobre varias filas a la vez (candidatos o capas).
+    years: año de cada evento, ordenados por año (y HuracanID dentro del año).
+    capped: (filas x eventos) pagos ya topados por evento; limit_aggs: (filas,).
+    Retorna (pagos ajustados [filas x eventos], pago anual [filas x HISTORICAL_YEARS]).
+    """
+    years = np.asarray(years, dtype=np.int64)
+    annual = np.zeros((capped.shape[0], len(HISTORICAL_YEARS)))
+    if len(years) == 0:
+        return np.zeros(capped.shape), annual
+    
+    # Misma cuenta que apply_annual_aggregate, por fila
+    group_start = np.concatenate([[True], years[1:] != years[:-1]])
+    spent_before = _spent_before(np.asarray(capped, dtype=float), group_start)
+    pay = np.minimum(capped, np.maximum(0.0, np.asarray(limit_aggs, dtype=float)[:, None] - spent_before))
+    
+    # Pago anual (años sin eventos = 0); los años fuera del ciclo no entran, igual
+    # que en el merge de _apply_annual_aggregate
+    starts = np.flatnonzero(group_start)
+    start_years = years[starts]
+    in_cycle = (start_years >= HISTORICAL_YEARS[0]) & (start_years <= HISTORICAL_YEARS[-1])
+    annual[:, start_years[in_cycle] - HISTORICAL_YEARS[0]] = np.add.reduceat(pay, starts, axis=1)[:, in_cycle]
+    return pay, annual
+
+def price_limit_grid(loss_table, limit_events, limit_aggs):
+    """
+    Prima y RoL (Base y Agresivo) para cada candidato (limit_events[k], limit_aggs[k]).
+    Los arrays se alinean por broadcasting (un escalar vale para todos).
+    Retorna un DataFrame con una fila por candidato.
+    """
+    limit_events, limit_aggs = np.broadcast_arrays(np.atleast_1d(np.asarray(limit_events, dtype=float)),
+                                                   np.atleast_1d(np.asarray(limit_aggs, dtype=float)))
+    capped = np.minimum(loss_table['raw'][None, :], limit_events[:, None])
+    _, annual = aggregate_rows(loss_table['year'], capped, limit_aggs)
+    
+    aal_all = annual.mean(axis=1)
+    aal_1949 = annual[:, HISTORICAL_YEARS >= 1949].mean(axis=1)
+    aal_25 = annual[:, HISTORICAL_YEARS >= HISTORICAL_YEARS[-1] - 25 + 1].mean(axis=1)
+    case, target_aal, rol_base, rol_agg = rol_scenarios(aal_all, aal_1949, aal_25, limit_aggs)
+    
+    return pd.DataFrame({
+        'Limite_Evento': limit_events,
+        'Limite_Agregado': limit_aggs,
+        'AAL_Target': target_aal,
+        'Caso': case,
+        'Net_RoL': rol_base,
+        'Prima_Neta_Trad': rol_base * limit_aggs,
+        'RoL_Agresivo': rol_agg,
+        'Prima_Agresiva': rol_agg * limit_aggs,
+    })
+
+def run_limit_optimizer(tracks, df_locations, df_payouts, limit_events, limit_aggs, asym_factor=0.5,
+                        target_rol=None, max_premium=None, scenario='Agresivo',
+                        n_workers=1, executor='process', circle_cache=None, memo_path=None):
+    """
+    Curva prima/RoL sobre la grilla limit_events x limit_aggs con una sola
+    corrida de geometría.
+    target_rol: RoL buscado (fracción, p. ej. 0.05): se elige el candidato más cercano.
+    max_premium: prima máxima: se elige el candidato con mayor límite agregado (y
+    luego por evento) cuya prima no la supera.
+    scenario: 'Agresivo' o 'Base' (columna de RoL/prima usada para el objetivo).
+    Retorna {'curve': DataFrame, 'best': dict del candidato elegido o None}.
+    """
+    geometry = compute_quote_geometry(tracks, df_locations, n_workers=n_workers, executor=executor,
+                                      circle_cache=circle_cache, memo_path=memo_path)
+    loss_table = event_loss_table(geometry, df_payouts, asym_factor)
+    grid_event, grid_agg = np.meshgrid(np.atleast_1d(np.asarray(limit_events, dtype=float)),
+                                       np.atleast_1d(np.asarray(limit_aggs, dtype=float)), indexing='ij')
+    curve = price_limit_grid(loss_table, grid_event.ravel(), grid_agg.ravel())
+    
+    if scenario == 'Agresivo':
+        rol_col, prima_col = 'RoL_Agresivo', 'Prima_Agresiva'
+    elif scenario == 'Base':
+        rol_col, prima_col = 'Net_RoL', 'Prima_Neta_Trad'
+    else:
+        raise ValueError(f"Escenario desconocido: {scenario!r} (use 'Agresivo' o 'Base').")
+    
+    candidates = curve
+    if max_premium is not None:
+        candidates = candidates[candidates[prima_col] <= max_premium]
+    if target_rol is not None and not candidates.empty:
+        gap = (candidates[rol_col] - target_rol).abs()
+        candidates = candidates[gap == gap.min()]
+    best = None
+    if not candidates.empty and (target_rol is not None or max_premium is not None):
+        # Entre empates se prefiere la mayor cobertura
+        best = candidates.sort_values(['Limite_Agregado', 'Limite_Evento'], kind='stable').iloc[[-1]].to_dict('records')[0]
+    return {'curve': curve, 'best': best}
+
+# ==============================================================================
+# 6. PROGRAMAS POR CAPAS (TRAMOS CON PRIORIDAD)
+# ==============================================================================
+# Cada capa cubre el tramo (prioridad, prioridad + limit_event] del pago de cada
+# evento (antes de topes) y tiene su propio límite agregado anual. El reparto de
+# todos los eventos en todas las capas es una sola operación (capas x eventos);
+# una capa sin prioridad reproduce la cotización simple (run_engine_calculation).
+
+def run_program_calculation(tracks, df_locations, df_payouts, layers, asym_factor=0.5,
+                            n_workers=1, executor='process', circle_cache=None, memo_path=None,
+                            n_boot=0, boot_seed=0):
+    """
+    Cotiza un programa de varias capas sobre los mismos círculos y la misma geometría.
+    layers: lista de dicts con 'limit_event', 'limit_agg' y, opcionalmente,
+    'attachment' (prioridad por evento, 0 por defecto) y 'name'.
+    Retorna {'layers': [{'name', 'attachment', 'limit_event', 'limit_agg',
+    'events', 'stats'}, ...], 'stats' (totales del programa), 'diagnostics'}.
+    Cada evento de una capa lleva su 'Prioridad' (descontada en render_breakdown_text).
+    """
+    geometry = compute_quote_geometry(tracks, df_locations, n_workers=n_workers, executor=executor,
+                                      circle_cache=circle_cache, memo_path=memo_path)
+    raw = raw_event_payouts(geometry, df_payouts, asym_factor)
+    order = _paid_event_order(geometry, raw['trad'])
+    years = geometry['year'][order].astype(np.int64)
+    
+    attachment = np.array([float(layer.get('attachment', 0.0)) for layer in layers])
+    limit_event = np.array([float(layer['limit_event']) for layer in layers])
+    limit_agg = np.array([float(layer['limit_agg']) for layer in layers])
+    
+    # Reparto por capas (capas x eventos): tramo del pago sobre la prioridad, topado por el límite por evento
+    excess_t = raw['trad'][order][None, :] - attachment[:, None]
+    layer_t = np.clip(excess_t, 0.0, limit_event[:, None])
+    layer_a = np.clip(raw['asym'][order][None, :] - attachment[:, None], 0.0, limit_event[:, None])
+    layer_adj, annual = aggregate_rows(years, layer_t, limit_agg)
+    
+    locations = geometry['locations']
+    winners = {}
+    def event_winners(i):
+        # Los ganadores son los mismos en todas las capas: se arman una vez por evento
+        if i not in winners:
+            w = raw['winners'][i]
+            winners[i] = _event_winners(locations, w[w >= 0], raw['wind_kmh'][i], raw['pct'][i], raw['pay_t'][i])
+        return winners[i]
+    
+    results = []
+    for k, layer in enumerate(layers):
+        paid = np.flatnonzero(layer_adj[k] > 0)
+        # Orden por HuracanID (igual que la cotización simple)
+        paid = paid[np.argsort(geometry['hid'][order][paid].astype(str), kind='stable')]
+        events = [{
+            'HuracanID': geometry['hid'][order[j]],
+            'Name': geometry['name'][order[j]],
+            'Year': int(years[j]),
+            'PagoEventoRaw': float(layer_t[k, j]),
+            'PagoAsymRaw': float(layer_a[k, j]),
+            'Prioridad': float(attachment[k]),
+            'TopeEvento': bool(excess_t[k, j] > limit_event[k]),
+            'Ganadores': event_winners(order[j]),
+            'PagoEventoAdj': float(layer_adj[k, j]),
+            'RecorteAgregado': bool(layer_adj[k, j] < layer_t[k, j]),
+        } for j in paid]
+        
+        df_annual = pd.DataFrame({'Year': HISTORICAL_YEARS, 'PagoAnual': annual[k]})
+        stats = quote_stats(df_annual, float(limit_agg[k]), years[paid], layer_adj[k, paid],
+                            n_boot=n_boot, boot_seed=boot_seed)
+        results.append({
+            'name': layer.get('name', f"Capa {k + 1}"),
+            'attachment': float(attachment[k]),
+            'limit_event': float(limit_event[k]),
+            'limit_agg': float(limit_agg[k]),
+            'events': events,
+            'stats': stats,
+        })
+    
+    program_stats = {
+        'Prima_Neta_Trad': sum(r['stats']['Prima_Neta_Trad'] for r in results),
+        'Prima_Agresiva': sum(r['stats']['Prima_Agresiva'] for r in results),
+        'AAL_Target': sum(r['stats']['AAL_Target'] for r in results),
+        'Capas': len(results),
+    }
+    return {'layers': results, 'stats': program_stats, 'diagnostics': _geometry_diagnostics(geometry)}
@@ -0,0 +1,99 @@
+import sqlite3
+import threading
+
+import numpy as np
+
+# ==============================================================================
+# MEMO PERSISTENTE DE GEOMETRÍA (SQLITE)
+# ==============================================================================
+# Guarda, por (dataset, centro redondeado, radio) y huracán (HID), el viento
+# máximo y el lado. La tabla memo_circles marca los círculos ya calculados
+# (incluye los que no tocó ningún huracán). La versión del dataset forma parte
+# de la clave: al cambiar los datos las filas viejas dejan de usarse.
+# SQLite en modo WAL permite varios lectores concurrentes (workers de Streamlit)
+# mientras un proceso escribe.
+
+CENTER_DECIMALS = 6
+RADIUS_DECIMALS = 3
+
+_LOCAL = threading.local()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS memo_circles (
+    dataset TEXT NOT NULL, lat REAL NOT NULL, lon REAL NOT NULL, radius REAL NOT NULL,
+    n_candidates INTEGER NOT NULL,
+    PRIMARY KEY (dataset, lat, lon, radius)
+);
+CREATE TABLE IF NOT EXISTS memo_winds (
+    dataset TEXT NOT NULL, lat REAL NOT NULL, lon REAL NOT NULL, radius REAL NOT NULL,
+    hid TEXT NOT NULL, wind_kt REAL NOT NULL, izq INTEGER NOT NULL,
+    PRIMARY KEY (dataset, lat, lon, radius, hid)
+);
+"""
+
+def _connect(path):
+    """Conexión por hilo (sqlite3 no comparte conexiones entre hilos)."""
+    conns = getattr(_LOCAL, 'conns', None)
+    if conns is None:
+        conns = _LOCAL.conns = {}
+    if path not in conns:
+        conn = sqlite3.connect(path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        conns[path] = conn
+    return conns[path]
+
+def memo_key(lat, lon, radius_km):
+    """Clave del círculo: centro y radio redondeados."""
+    return (round(float(lat), CENTER_DECIMALS), round(float(lon), CENTER_DECIMALS),
+            round(float(radius_km), RADIUS_DECIMALS))
+
+def load_circles(path, dataset, keys):
+    """
+    Entradas guardadas para los círculos pedidos, dict {clave: entrada}.
+    Cada entrada tiene 'hid', 'wind_kt', 'izq' (arrays) y 'n_candidates'.
+    """
+    conn = _connect(path)
+    found = {}
+    for key in dict.fromkeys(keys):
+        row = conn.execute(
+            "SELECT n_candidates FROM memo_circles WHERE dataset=? AND lat=? AND lon=? AND radius=?",
+            (dataset, *key)
+        ).fetchone()
+        if row is None:
+            continue
+        rows = conn.execute(
+            "SELECT hid, wind_kt, izq FROM memo_winds WHERE dataset=? AND lat=? AND lon=? AND radius=?",
+            (dataset, *key)
+        ).fetchall()
+        found[key] = {
+            'hid': np.array([r[0] for r in rows], dtype=object),
+            'wind_kt': np.array([r[1] for r in rows], dtype=float),
+            'izq': np.array([bool(r[2]) for r in rows], dtype=bool),
+            'n_candidates': int(row[0]),
+        }
+    return found
+
+def save_circles(path, dataset, entries):
+    """Guarda entradas {clave: entrada} en una sola transacción (idempotente)."""
+    conn = _connect(path)
+    with conn:
+        for key, e in entries.items():
+            conn.executemany(
+                "INSERT OR REPLACE INTO memo_winds VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(dataset, *key, str(hid), float(w), int(izq))
+                 for hid, w, izq in zip(e['hid'], e['wind_kt'], e['izq'])]
+            )
+            # El círculo se marca como completo al final, dentro de la misma transacción
+            conn.execute(
+                "INSERT OR REPLACE INTO memo_circles VALUES (?, ?, ?, ?, ?)",
+                (dataset, *key, int(e['n_candidates']))
+            )
+
+def purge_other_datasets(path, dataset):
+    """Borra las filas de versiones del dataset distintas a la actual."""
+    conn = _connect(path)
+    with conn:
+        conn.execute("DELETE FROM memo_winds WHERE dataset<>?", (dataset,))
+        conn.execute("DELETE FROM memo_circles WHERE dataset<>?", (dataset,))
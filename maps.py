@@ -18,7 +18,11 @@ def generate_interactive_map(df_hurdat, df_locations, huracan_id):
     Retorna el objeto mapa (folium.Map) sin renderizarlo para evitar duplicados.
     """
     # 1. Filtrar los datos para el huracán seleccionado
-    df_trayectoria = df_hurdat[df_hurdat['HID'] == huracan_id].sort_values(['Date', 'Time'])
+    # Tabla compacta (data_loader.compact_track_table): un solo Timestamp en lugar de Date/Time
+    sort_cols = ['Timestamp'] if 'Timestamp' in df_hurdat.columns else ['Date', 'Time']
+    df_trayectoria = df_hurdat[df_hurdat['HID'] == huracan_id].sort_values(sort_cols)
+    # float32 -> float64 redondeado, para no mostrar 17.299999237 en lugar de 17.3
+    df_trayectoria = df_trayectoria.astype({'Lat': float, 'Lon': float, 'Wind_kt': float}).round({'Lat': 4, 'Lon': 4})
     
     if df_trayectoria.empty:
         return None
@@ -69,8 +73,9 @@ def generate_interactive_map(df_hurdat, df_locations, huracan_id):
         segment_colors.append(color)
 
         # Popup con velocidad en nudos y km/h
+        fecha = row['Timestamp'].strftime('%Y%m%d %H%M') if 'Timestamp' in row else f"{row['Date']} {row['Time']}"
         popup_text = f"""
-        <b>Fecha:</b> {row['Date']} {row['Time']}<br>
+        <b>Fecha:</b> {fecha}<br>
         <b>Cat:</b> {cat}<br>
         <b>Viento:</b> {wind} kt / {wind_kmh:.1f} km/h
         """
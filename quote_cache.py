@@ -0,0 +1,154 @@
+import copy
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+
+import engine
+from track_store import build_track_store
+
+# ==============================================================================
+# CACHÉ DE COTIZACIONES (LRU EN MEMORIA + DISCO OPCIONAL)
+# ==============================================================================
+# La clave es un hash estable de las entradas canonizadas (ubicaciones, tabla
+# de pagos, límites, factor asimétrico) y de la versión del dataset de
+# trayectorias. Si cambian los datos o la lógica (CACHE_SCHEMA), la clave cambia.
+
+# 2: stats con curvas de excedencia (PML/TVaR)
+CACHE_SCHEMA = 2
+
+_MEMORY = OrderedDict()
+_CONFIG = {'max_entries': 256, 'disk_dir': None}
+_STATS = {'hits': 0, 'disk_hits': 0, 'misses': 0}
+
+def configure(max_entries=256, disk_dir=None):
+    """Tamaño máximo del LRU en memoria y carpeta opcional del almacén en disco."""
+    _CONFIG['max_entries'] = int(max_entries)
+    _CONFIG['disk_dir'] = disk_dir
+    if disk_dir:
+        os.makedirs(disk_dir, exist_ok=True)
+    while len(_MEMORY) > _CONFIG['max_entries']:
+        _MEMORY.popitem(last=False)
+
+def cache_stats():
+    """Contadores de aciertos (memoria y disco), fallos y entradas en memoria."""
+    return dict(_STATS, entries=len(_MEMORY))
+
+def clear():
+    """Vacía el LRU en memoria y reinicia los contadores (no toca el disco)."""
+    _MEMORY.clear()
+    for k in _STATS:
+        _STATS[k] = 0
+
+def _num(x):
+    """Número canónico: 40, 40.0 y '40' producen la misma representación."""
+    x = float(x)
+    return 0.0 if np.isnan(x) else x
+
+def canonical_inputs(df_locations, df_payouts, limit_event, limit_agg, asym_factor):
+    """Representación canónica (JSON-serializable) de una cotización."""
+    locations = [
+        [int(r['ID']), _num(r['Lat']), _num(r['Lon']), _num(r['Radius']), _num(r['Limit'])]
+        for r in df_locations[['ID', 'Lat', 'Lon', 'Radius', 'Limit']].to_dict('records')
+    ]
+
+    # La tabla se compara como la usa el motor: ordenada por min_speed y en fracción,
+    # solo con las columnas que lee (C{ID} de cada círculo y 'payout'); el resto se ignora
+    used = {f"C{loc[0]}" for loc in locations} | {'payout'}
+    columns = sorted(c for c in df_payouts.columns if str(c) in used)
+    df_sorted = df_payouts.sort_values('min_speed', kind='stable')
+    payouts = {'min_speed': [_num(v) for v in df_sorted['min_speed']]}
+    for c in columns:
+        values = [_num(v) for v in df_sorted[c]]
+        payouts[str(c)] = [v / 100.0 if v > 1.0 else v for v in values]
+
+    return {
+        'locations': locations,
+        'payouts': payouts,
+        'limit_event': _num(limit_event),
+        'limit_agg': _num(limit_agg),
+        'asym_factor': _num(asym_factor),
+    }
+
+def quote_key(dataset_version, df_locations, df_payouts, limit_event, limit_agg, asym_factor, bootstrap=None):
+    """
+    Clave de contenido (sha256) de una cotización.
+    bootstrap: (n_boot, semilla) si se piden bandas de bootstrap (cambian el resultado).
+    """
+    payload = {
+        'schema': CACHE_SCHEMA,
+        'dataset': dataset_version,
+        'inputs': canonical_inputs(df_locations, df_payouts, limit_event, limit_agg, asym_factor),
+    }
+    if bootstrap and bootstrap[0] > 0:
+        payload['bootstrap'] = [int(bootstrap[0]), int(bootstrap[1])]
+    blob = json.dumps(payload, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+def _disk_path(key):
+    return os.path.join(_CONFIG['disk_dir'], key[:2], f"{key}.pkl")
+
+def _remember(key, result):
+    _MEMORY[key] = result
+    _MEMORY.move_to_end(key)
+    while len(_MEMORY) > _CONFIG['max_entries']:
+        _MEMORY.popitem(last=False)
+
+def get(key):
+    """Resultado cacheado o None. Busca en memoria y luego en disco."""
+    if key in _MEMORY:
+        _MEMORY.move_to_end(key)
+        _STATS['hits'] += 1
+        return copy.deepcopy(_MEMORY[key])
+
+    if _CONFIG['disk_dir']:
+        path = _disk_path(key)
+        try:
+            with open(path, 'rb') as f:
+                result = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            result = None
+        if result is not None:
+            _STATS['disk_hits'] += 1
+            _remember(key, result)
+            return copy.deepcopy(result)
+
+    _STATS['misses'] += 1
+    return None
+
+def put(key, result):
+    """Guarda un resultado en memoria y, si está configurado, en disco (escritura atómica)."""
+    _remember(key, copy.deepcopy(result))
+    if not _CONFIG['disk_dir']:
+        return
+    path = _disk_path(key)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Advertencia: no se pudo escribir la caché en disco: {e}")
+
+def cached_engine_calculation(tracks, df_locations, df_payouts, limit_event, limit_agg, asym_factor, **engine_kwargs):
+    """
+    Igual que engine.run_engine_calculation, pero consulta la caché antes de calcular.
+    engine_kwargs (n_workers, executor) no forman parte de la clave: no cambian el resultado;
+    n_boot y boot_seed sí.
+    """
+    store = tracks if isinstance(tracks, dict) else build_track_store(tracks)
+    bootstrap = (engine_kwargs.get('n_boot', 0), engine_kwargs.get('boot_seed', 0))
+    key = quote_key(store['version'], df_locations, df_payouts, limit_event, limit_agg, asym_factor,
+                    bootstrap=bootstrap)
+
+    result = get(key)
+    if result is None:
+        result = engine.run_engine_calculation(store, df_locations, df_payouts,
+                                               limit_event, limit_agg, asym_factor, **engine_kwargs)
+        put(key, result)
+    return result
@@ -0,0 +1,92 @@
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from track_cache import write_json_atomic
+from track_store import POINT_FIELDS, STORM_FIELDS
+
+# ==============================================================================
+# ALMACÉN DE TRAYECTORIAS COMPARTIDO (ARCHIVOS MEMORY-MAPPED)
+# ==============================================================================
+# Un proceso publica el almacén (track_store) una vez en shared_dir/<versión>/,
+# un .npy por array. Los demás procesos (réplicas de Streamlit, workers del
+# motor) lo abren con mmap en solo lectura: el sistema operativo comparte las
+# mismas páginas físicas entre todos, sin pickling ni copias.
+# 'hid' y 'name' se guardan como texto de ancho fijo (los object no admiten mmap).
+# current.json apunta a la última versión publicada y a las fuentes de la que salió.
+
+_INDEX_ARRAYS = ('seg_start', 'seg_storm', 'lat_lo', 'lat_hi', 'lon_lo', 'lon_hi',
+                 'cell_offsets', 'cell_segments')
+_INDEX_SCALARS = ('cell_deg', 'lat0', 'lon0', 'n_lat', 'n_lon')
+CURRENT = 'current.json'
+
+_ATTACHED = {}
+
+def publish_store(store, shared_dir, sources=None):
+    """
+    Publica el almacén en shared_dir/<versión> (si ya existe no se reescribe) y
+    lo marca como vigente. sources: firma opcional de los archivos de origen.
+    Retorna la ruta de la versión publicada.
+    """
+    os.makedirs(shared_dir, exist_ok=True)
+    folder = os.path.join(shared_dir, store['version'])
+
+    if not os.path.isdir(folder):
+        # Se escribe en una carpeta temporal y se renombra: los lectores nunca ven una versión a medias
+        tmp = tempfile.mkdtemp(dir=shared_dir, prefix='.tmp-')
+        for k in POINT_FIELDS + STORM_FIELDS + ('offsets',):
+            values = store[k].astype(str) if store[k].dtype == object else store[k]
+            np.save(os.path.join(tmp, f"{k}.npy"), np.ascontiguousarray(values))
+        index = store['segments']
+        for k in _INDEX_ARRAYS:
+            np.save(os.path.join(tmp, f"segments.{k}.npy"), np.ascontiguousarray(index[k]))
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump({'version': store['version'],
+                       'segments': {k: index[k] for k in _INDEX_SCALARS}}, f)
+        try:
+            os.rename(tmp, folder)
+        except OSError:
+            # Otro proceso publicó la misma versión primero
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    previous = read_current(shared_dir)
+    write_json_atomic(os.path.join(shared_dir, CURRENT), {'version': store['version'], 'sources': sources})
+
+    # Se conservan la versión nueva y la anterior (puede seguir abierta en otras réplicas)
+    keep = {store['version'], previous['version'] if previous else None}
+    for entry in os.listdir(shared_dir):
+        path = os.path.join(shared_dir, entry)
+        if os.path.isdir(path) and not entry.startswith('.tmp-') and entry not in keep:
+            shutil.rmtree(path, ignore_errors=True)
+    return folder
+
+def read_current(shared_dir):
+    """Contenido de current.json (versión vigente y firma de fuentes) o None."""
+    try:
+        with open(os.path.join(shared_dir, CURRENT)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def attach_store(path):
+    """
+    Almacén de solo lectura sobre los archivos publicados en path (carpeta de
+    una versión). Se abre una vez por proceso; llamadas siguientes no cuestan nada.
+    """
+    if path in _ATTACHED:
+        return _ATTACHED[path]
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+
+    store = {k: np.load(os.path.join(path, f"{k}.npy"), mmap_mode='r')
+             for k in POINT_FIELDS + STORM_FIELDS + ('offsets',)}
+    segments = {k: np.load(os.path.join(path, f"segments.{k}.npy"), mmap_mode='r') for k in _INDEX_ARRAYS}
+    segments.update(meta['segments'])
+    store['segments'] = segments
+    store['version'] = meta['version']
+    store['shared_path'] = path
+    _ATTACHED[path] = store
+    return store
@@ -0,0 +1,164 @@
+import numpy as np
+
+# ==============================================================================
+# ÍNDICE ESPACIAL DE SEGMENTOS (GRILLA UNIFORME LAT/LON)
+# ==============================================================================
+# Cada segmento une dos puntos consecutivos del mismo huracán. Se registra en
+# todas las celdas de la grilla que toca su caja envolvente, en formato CSR:
+# los segmentos de la celda c son cell_segments[cell_offsets[c]:cell_offsets[c+1]].
+
+def _segment_boxes(store):
+    """Segmentos del almacén: inicio, huracán y caja envolvente de cada uno."""
+    offsets = store['offsets']
+    n_points = len(store['lat'])
+
+    # Segmento i -> puntos (seg_start[i], seg_start[i] + 1) del mismo huracán
+    is_last = np.zeros(n_points, dtype=bool)
+    is_last[offsets[1:] - 1] = True
+    seg_start = np.flatnonzero(~is_last).astype(np.int64)
+    seg_storm = (np.searchsorted(offsets, seg_start, side='right') - 1).astype(np.int32)
+
+    lat1, lat2 = store['lat'][seg_start], store['lat'][seg_start + 1]
+    lon1, lon2 = store['lon'][seg_start], store['lon'][seg_start + 1]
+    return {
+        'seg_start': seg_start,
+        'seg_storm': seg_storm,
+        'lat_lo': np.minimum(lat1, lat2), 'lat_hi': np.maximum(lat1, lat2),
+        'lon_lo': np.minimum(lon1, lon2), 'lon_hi': np.maximum(lon1, lon2),
+    }
+
+def _segment_cells(index, segs):
+    """Expande los segmentos pedidos a todas sus celdas (sin bucles en Python): (segmento, celda)."""
+    cd, n_lon = index['cell_deg'], index['n_lon']
+    i0 = ((index['lat_lo'][segs] - index['lat0']) // cd).astype(np.int64)
+    i1 = ((index['lat_hi'][segs] - index['lat0']) // cd).astype(np.int64)
+    j0 = ((index['lon_lo'][segs] - index['lon0']) // cd).astype(np.int64)
+    j1 = ((index['lon_hi'][segs] - index['lon0']) // cd).astype(np.int64)
+
+    nj = j1 - j0 + 1
+    n_cells = (i1 - i0 + 1) * nj
+    seg_rep = np.repeat(segs, n_cells)
+    first = np.cumsum(n_cells) - n_cells
+    local = np.arange(n_cells.sum(), dtype=np.int64) - np.repeat(first, n_cells)
+    cell = (np.repeat(i0, n_cells) + local // np.repeat(nj, n_cells)) * n_lon + \
+           (np.repeat(j0, n_cells) + local % np.repeat(nj, n_cells))
+    return seg_rep, cell
+
+def build_segment_index(store, cell_deg=1.0):
+    """Construye el índice de segmentos sobre un almacén de track_store."""
+    index = _segment_boxes(store)
+    index['cell_deg'] = float(cell_deg)
+
+    if len(index['seg_start']) == 0:
+        index.update({'lat0': 0.0, 'lon0': 0.0, 'n_lat': 1, 'n_lon': 1,
+                      'cell_offsets': np.zeros(2, dtype=np.int64),
+                      'cell_segments': np.zeros(0, dtype=np.int64)})
+        return index
+
+    lat0 = np.floor(index['lat_lo'].min())
+    lon0 = np.floor(index['lon_lo'].min())
+    index.update({
+        'lat0': float(lat0), 'lon0': float(lon0),
+        'n_lat': int((index['lat_hi'].max() - lat0) // cell_deg) + 1,
+        'n_lon': int((index['lon_hi'].max() - lon0) // cell_deg) + 1,
+    })
+
+    seg_rep, cell = _segment_cells(index, np.arange(len(index['seg_start']), dtype=np.int64))
+    order = np.argsort(cell, kind='stable')
+    n_grid = index['n_lat'] * index['n_lon']
+    cell_offsets = np.zeros(n_grid + 1, dtype=np.int64)
+    np.cumsum(np.bincount(cell, minlength=n_grid), out=cell_offsets[1:])
+
+    index.update({'cell_offsets': cell_offsets, 'cell_segments': seg_rep[order]})
+    return index
+
+def update_segment_index(index, old_offsets, store, old_to_new, updated_storms):
+    """
+    Índice del almacén actualizado sin reconstruir las celdas de los huracanes
+    que no cambiaron: sus entradas se renumeran y solo se expanden a celdas los
+    segmentos de updated_storms (ids en el almacén nuevo).
+    old_offsets: offsets del almacén anterior; old_to_new: huracán viejo -> nuevo (-1 si salió).
+    Si algún segmento nuevo cae fuera de la grilla actual, se reconstruye todo.
+    """
+    cd = index['cell_deg']
+    new_index = _segment_boxes(store)
+    new_index.update({k: index[k] for k in ('cell_deg', 'lat0', 'lon0', 'n_lat', 'n_lon')})
+
+    new_segs = np.flatnonzero(np.isin(new_index['seg_storm'], updated_storms))
+    lat_top = index['lat0'] + index['n_lat'] * cd
+    lon_top = index['lon0'] + index['n_lon'] * cd
+    outside = ((new_index['lat_lo'][new_segs] < index['lat0']) | (new_index['lat_hi'][new_segs] >= lat_top) |
+               (new_index['lon_lo'][new_segs] < index['lon0']) | (new_index['lon_hi'][new_segs] >= lon_top))
+    if len(index['seg_start']) == 0 or outside.any():
+        return build_segment_index(store, cd)
+
+    # Entradas existentes: segmento viejo -> nuevo (mismo lugar dentro de su huracán)
+    n_grid = index['n_lat'] * index['n_lon']
+    entry_cell = np.repeat(np.arange(n_grid, dtype=np.int64), np.diff(index['cell_offsets']))
+    old_seg = index['cell_segments']
+    old_storm = index['seg_storm'][old_seg]
+    new_storm = old_to_new[old_storm]
+    keep = new_storm >= 0
+    old_base = old_offsets[:-1] - np.arange(len(old_offsets) - 1)
+    new_base = store['offsets'][:-1] - np.arange(len(store['offsets']) - 1)
+    kept_seg = new_base[new_storm[keep]] + (old_seg[keep] - old_base[old_storm[keep]])
+    kept_cell = entry_cell[keep]
+
+    # Entradas nuevas, agrupadas por celda
+    add_seg, add_cell = _segment_cells(new_index, new_segs)
+    order = np.argsort(add_cell, kind='stable')
+    add_seg, add_cell = add_seg[order], add_cell[order]
+
+    # Cada celda: primero sus entradas existentes (ya vienen agrupadas) y luego las nuevas
+    kept_count = np.bincount(kept_cell, minlength=n_grid)
+    add_count = np.bincount(add_cell, minlength=n_grid)
+    cell_offsets = np.zeros(n_grid + 1, dtype=np.int64)
+    np.cumsum(kept_count + add_count, out=cell_offsets[1:])
+    kept_first = np.cumsum(kept_count) - kept_count
+    add_first = np.cumsum(add_count) - add_count
+
+    cell_segments = np.empty(cell_offsets[-1], dtype=np.int64)
+    kept_rank = np.arange(len(kept_cell)) - kept_first[kept_cell]
+    cell_segments[cell_offsets[kept_cell] + kept_rank] = kept_seg
+    add_rank = np.arange(len(add_cell)) - add_first[add_cell]
+    cell_segments[cell_offsets[add_cell] + kept_count[add_cell] + add_rank] = add_seg
+
+    new_index.update({'cell_offsets': cell_offsets, 'cell_segments': cell_segments})
+    return new_index
+
+def query_box(c_lat, c_lon, radius_km):
+    """
+    Caja (lat_lo, lat_hi, lon_lo, lon_hi) que contiene tanto el círculo como la
+    caja de rad_deg que usa el filtro de segmentos del motor.
+    """
+    rad_deg = (radius_km / 111.0) + 1.0
+    far_lat = min(abs(c_lat) + rad_deg, 89.0)
+    lon_deg = rad_deg / np.cos(np.radians(far_lat))
+    return c_lat - rad_deg, c_lat + rad_deg, c_lon - lon_deg, c_lon + lon_deg
+
+def query_segments(index, c_lat, c_lon, radius_km):
+    """Ids (ordenados) de los segmentos cuya caja toca la caja de consulta del círculo."""
+    lat_lo, lat_hi, lon_lo, lon_hi = query_box(c_lat, c_lon, radius_km)
+    cd, n_lat, n_lon = index['cell_deg'], index['n_lat'], index['n_lon']
+
+    i0 = max(int((lat_lo - index['lat0']) // cd), 0)
+    i1 = min(int((lat_hi - index['lat0']) // cd), n_lat - 1)
+    j0 = max(int((lon_lo - index['lon0']) // cd), 0)
+    j1 = min(int((lon_hi - index['lon0']) // cd), n_lon - 1)
+    if i0 > i1 or j0 > j1:
+        return np.zeros(0, dtype=np.int64)
+
+    cells = (np.arange(i0, i1 + 1)[:, None] * n_lon + np.arange(j0, j1 + 1)[None, :]).ravel()
+    starts = index['cell_offsets'][cells]
+    lengths = index['cell_offsets'][cells + 1] - starts
+    total = lengths.sum()
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    first = np.cumsum(lengths) - lengths
+    pos = np.repeat(starts - first, lengths) + np.arange(total)
+    segs = np.unique(index['cell_segments'][pos])
+
+    # Filtro exacto contra la caja de cada segmento
+    keep = ~((index['lat_lo'][segs] > lat_hi) | (index['lat_hi'][segs] < lat_lo) |
+             (index['lon_lo'][segs] > lon_hi) | (index['lon_hi'][segs] < lon_lo))
+    return segs[keep]
@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+# ==============================================================================
+# CACHÉ BINARIA COLUMNAR DE LA TABLA DE TRAYECTORIAS
+# ==============================================================================
+# La tabla ya fusionada y limpia (TXT + Excel, con categorías) se guarda como un
+# .npy por columna dentro de cache_dir/<clave>/, y se lee con memory-map.
+# Columnas de texto: códigos int32 (.npy) + valores únicos (<col>.uniques.npy).
+# manifest.json guarda tamaño, mtime y sha256 de cada archivo fuente:
+#   - tamaño y mtime iguales          -> caché válida sin leer las fuentes
+#   - cambian, pero el sha256 coincide -> caché válida (se actualiza el manifest)
+#   - el contenido cambió              -> se reconstruye
+
+# Subir al cambiar el formato o la lógica de parseo: invalida las cachés existentes
+CACHE_FORMAT = 3
+MANIFEST = 'manifest.json'
+
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def _stat(path):
+    """Tamaño y mtime de una fuente (None si no existe)."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return {'path': os.path.abspath(path), 'exists': False, 'size': None, 'mtime_ns': None}
+    return {'path': os.path.abspath(path), 'exists': True, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+def source_signature(paths):
+    """Tamaño, mtime y sha256 de cada fuente."""
+    sources = []
+    for path in paths:
+        info = _stat(path)
+        info['sha256'] = _sha256(path) if info['exists'] else None
+        sources.append(info)
+    return sources
+
+def _cache_key(sources):
+    blob = json.dumps([CACHE_FORMAT, [s['sha256'] for s in sources]])
+    return hashlib.sha256(blob.encode('utf-8')).hexdigest()[:16]
+
+def _read_manifest(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, MANIFEST)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get('format') == CACHE_FORMAT else None
+
+def write_json_atomic(path, payload):
+    """Escribe JSON vía archivo temporal + os.replace: los lectores nunca ven un archivo a medias."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(payload, f)
+    os.replace(tmp_path, path)
+
+def _valid_key(cache_dir, paths):
+    """Clave de la caché si sigue siendo válida para las fuentes actuales, o None."""
+    manifest = _read_manifest(cache_dir)
+    if manifest is None or len(manifest['sources']) != len(paths):
+        return None
+
+    current = [_stat(p) for p in paths]
+    fast_match = all(
+        c['path'] == s['path'] and c['exists'] == s['exists'] and
+        c['size'] == s['size'] and c['mtime_ns'] == s['mtime_ns']
+        for c, s in zip(current, manifest['sources'])
+    )
+    if not fast_match:
+        # Tamaño o mtime distintos: se decide por contenido (p. ej. archivo copiado o "touch")
+        sources = source_signature(paths)
+        if _cache_key(sources) != manifest['key']:
+            return None
+        manifest['sources'] = sources
+        try:
+            write_json_atomic(os.path.join(cache_dir, MANIFEST), manifest)
+        except OSError:
+            pass
+    return manifest['key']
+
+def read_cache(cache_dir, paths):
+    """DataFrame cacheado para las fuentes dadas, o None si no hay caché válida."""
+    key = _valid_key(cache_dir, paths)
+    if key is None:
+        return None
+    manifest = _read_manifest(cache_dir)
+    folder = os.path.join(cache_dir, key)
+    try:
+        columns = {}
+        for col in manifest['columns']:
+            values = np.load(os.path.join(folder, f"{col['name']}.npy"), mmap_mode='r')
+            if col['kind'] == 'codes':
+                uniques = np.load(os.path.join(folder, f"{col['name']}.uniques.npy"), allow_pickle=True)
+                # Los códigos siguen mapeados; código -1 = valor faltante
+                values = pd.Categorical.from_codes(values, categories=pd.Index(uniques),
+                                                   validate=False)
+            columns[col['name']] = values
+        index = np.load(os.path.join(folder, '__index__.npy'), mmap_mode='r')
+    except (OSError, ValueError, KeyError):
+        return None
+    # copy=False: las columnas numéricas quedan respaldadas por los .npy mapeados (solo lectura)
+    return pd.DataFrame(columns, index=pd.Index(index, copy=False), copy=False)
+
+def write_cache(cache_dir, paths, df):
+    """
+    Escribe la tabla en la caché y la marca como vigente para las fuentes dadas.
+    Si la carpeta de esa clave ya existe no se reescribe: puede estar mapeada por otros lectores.
+    """
+    sources = source_signature(paths)
+    key = _cache_key(sources)
+    os.makedirs(cache_dir, exist_ok=True)
+    folder = os.path.join(cache_dir, key)
+
+    columns = [
+        {'name': name, 'kind': 'array' if (pd.api.types.is_numeric_dtype(df[name])
+                                           or pd.api.types.is_bool_dtype(df[name])) else 'codes'}
+        for name in df.columns
+    ]
+    if not os.path.isdir(folder):
+        # Se escribe en una carpeta temporal y se renombra: los lectores nunca ven columnas a medias
+        tmp = tempfile.mkdtemp(dir=cache_dir, prefix='.tmp-')
+        for col in columns:
+            series = df[col['name']]
+            if col['kind'] == 'array':
+                np.save(os.path.join(tmp, f"{col['name']}.npy"), series.to_numpy())
+            else:
+                codes, uniques = pd.factorize(series)
+                np.save(os.path.join(tmp, f"{col['name']}.npy"), codes.astype(np.int32))
+                np.save(os.path.join(tmp, f"{col['name']}.uniques.npy"),
+                        np.asarray(uniques, dtype=object), allow_pickle=True)
+        np.save(os.path.join(tmp, '__index__.npy'), df.index.to_numpy(dtype=np.int64))
+        # mkdtemp crea la carpeta con 0700; los lectores pueden correr con otro usuario
+        os.chmod(tmp, 0o755)
+        try:
+            os.rename(tmp, folder)
+        except OSError:
+            # Otro proceso escribió la misma clave primero
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    # El manifest se escribe al final: hasta entonces los lectores siguen con la versión anterior
+    write_json_atomic(os.path.join(cache_dir, MANIFEST), {
+        'format': CACHE_FORMAT, 'key': key, 'sources': sources,
+        'columns': columns, 'n_rows': int(len(df)),
+    })
+
+    # Limpiar carpetas de versiones anteriores (no las temporales de otros escritores)
+    for entry in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, entry)
+        if entry != key and not entry.startswith('.tmp-') and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+    return key
@@ -0,0 +1,210 @@
+import hashlib
+import pandas as pd
+import numpy as np
+from spatial_index import build_segment_index, update_segment_index
+
+# ==============================================================================
+# ALMACÉN COLUMNAR DE TRAYECTORIAS
+# ==============================================================================
+# Estructura (dict de arrays contiguos, construida una sola vez al cargar):
+#   'lat', 'lon', 'wind'  -> float64 (n_puntos,), ordenados por HID y luego por fecha/hora
+#   'time'                -> datetime64[m] (n_puntos,)
+#   'offsets'             -> int64 (n_huracanes + 1,), estilo CSR: el huracán k
+#                            ocupa los puntos [offsets[k], offsets[k+1])
+#   'hid', 'name'         -> metadatos por huracán (n_huracanes,)
+#   'year'                -> int32 (n_huracanes,)
+#   'lat_min', 'lat_max', 'lon_min', 'lon_max' -> caja envolvente por huracán
+#   'segments'            -> índice espacial de segmentos (spatial_index)
+#   'version'             -> huella (hash) del contenido, para invalidar cachés
+
+POINT_FIELDS = ('lat', 'lon', 'wind', 'time')
+STORM_FIELDS = ('hid', 'name', 'year', 'lat_min', 'lat_max', 'lon_min', 'lon_max')
+
+def build_track_store(df_hurdat):
+    """
+    Convierte la tabla de trayectorias (formato load_hurricane_data) en un
+    almacén columnar pre-ordenado por huracán y tiempo.
+    """
+    if df_hurdat.empty:
+        empty_f = np.zeros(0, dtype=np.float64)
+        store = {
+            'lat': empty_f, 'lon': empty_f.copy(), 'wind': empty_f.copy(),
+            'time': np.zeros(0, dtype='datetime64[m]'),
+            'offsets': np.zeros(1, dtype=np.int64),
+            'hid': np.zeros(0, dtype=object), 'name': np.zeros(0, dtype=object),
+            'year': np.zeros(0, dtype=np.int32),
+            'lat_min': empty_f.copy(), 'lat_max': empty_f.copy(),
+            'lon_min': empty_f.copy(), 'lon_max': empty_f.copy(),
+        }
+        store['segments'] = build_segment_index(store)
+        store['version'] = dataset_fingerprint(store)
+        return store
+
+    # Fecha + hora -> timestamp (HURDAT: 'YYYYMMDD' y 'HHMM'); la tabla compacta ya trae 'Timestamp'
+    if 'Timestamp' in df_hurdat.columns:
+        times = df_hurdat['Timestamp'].to_numpy().astype('datetime64[m]')
+    else:
+        stamp = df_hurdat['Date'].astype(str).str.strip() + df_hurdat['Time'].astype(str).str.strip().str.zfill(4)
+        times = pd.to_datetime(stamp, format='%Y%m%d%H%M', errors='coerce').to_numpy().astype('datetime64[m]')
+
+    hid_codes, hid_uniques = pd.factorize(df_hurdat['HID'].astype(str), sort=True)
+
+    # Orden estable: primero HID, luego tiempo (NaT al inicio, igual que un sort de texto vacío)
+    order = np.lexsort((times.view(np.int64), hid_codes))
+    hid_codes = hid_codes[order]
+
+    counts = np.bincount(hid_codes, minlength=len(hid_uniques))
+    offsets = np.zeros(len(hid_uniques) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    starts = offsets[:-1]
+
+    lat = np.ascontiguousarray(df_hurdat['Lat'].to_numpy(dtype=np.float64)[order])
+    lon = np.ascontiguousarray(df_hurdat['Lon'].to_numpy(dtype=np.float64)[order])
+    wind = np.ascontiguousarray(df_hurdat['Wind_kt'].to_numpy(dtype=np.float64)[order])
+
+    # Metadatos: se toman del primer punto (en orden temporal) de cada huracán
+    first_rows = order[starts]
+    names = df_hurdat['Name'].to_numpy()[first_rows].astype(str).astype(object)
+    years = pd.to_numeric(df_hurdat['Year'], errors='coerce').fillna(0).to_numpy()[first_rows].astype(np.int32)
+
+    store = {
+        'lat': lat,
+        'lon': lon,
+        'wind': wind,
+        'time': times[order],
+        'offsets': offsets,
+        'hid': np.asarray(hid_uniques, dtype=object),
+        'name': names,
+        'year': years,
+        'lat_min': np.minimum.reduceat(lat, starts),
+        'lat_max': np.maximum.reduceat(lat, starts),
+        'lon_min': np.minimum.reduceat(lon, starts),
+        'lon_max': np.maximum.reduceat(lon, starts),
+    }
+    store['segments'] = build_segment_index(store)
+    store['version'] = dataset_fingerprint(store)
+    return store
+
+def build_store_from_storms(storms):
+    """
+    Almacén a partir de huracanes sueltos (dicts de data_loader.iter_storms),
+    p. ej. un bloque de un catálogo leído en streaming.
+    """
+    storms = sorted(storms, key=lambda s: s['hid'])
+    if not storms:
+        return build_track_store(pd.DataFrame())
+    lengths = np.array([len(s['lat']) for s in storms], dtype=np.int64)
+    offsets = np.zeros(len(storms) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    starts = offsets[:-1]
+
+    store = {k: np.concatenate([s[k] for s in storms]) for k in POINT_FIELDS}
+    store['time'] = store['time'].astype('datetime64[m]')
+    store.update({
+        'offsets': offsets,
+        'hid': np.array([s['hid'] for s in storms], dtype=object),
+        'name': np.array([s['name'] for s in storms], dtype=object),
+        'year': np.array([s['year'] for s in storms], dtype=np.int32),
+        'lat_min': np.minimum.reduceat(store['lat'], starts),
+        'lat_max': np.maximum.reduceat(store['lat'], starts),
+        'lon_min': np.minimum.reduceat(store['lon'], starts),
+        'lon_max': np.maximum.reduceat(store['lon'], starts),
+    })
+    store['segments'] = build_segment_index(store)
+    store['version'] = dataset_fingerprint(store)
+    return store
+
+def dataset_fingerprint(store):
+    """Hash estable del contenido de las trayectorias (no depende del índice derivado)."""
+    h = hashlib.sha256()
+    for key in ('lat', 'lon', 'wind', 'time', 'offsets', 'year'):
+        h.update(np.ascontiguousarray(store[key]).tobytes())
+    h.update('\n'.join(f"{hid}|{name}" for hid, name in zip(store['hid'], store['name'])).encode('utf-8'))
+    return h.hexdigest()[:16]
+
+def n_storms(store):
+    """Número de huracanes en el almacén."""
+    return len(store['offsets']) - 1
+
+def storm_slice(store, k):
+    """Retorna (lat, lon, wind) del huracán k como vistas (sin copia) de los arrays."""
+    s, e = store['offsets'][k], store['offsets'][k + 1]
+    return store['lat'][s:e], store['lon'][s:e], store['wind'][s:e]
+
+def _gather_storms(store, storm_ids):
+    """Arrays por punto y por huracán de los huracanes pedidos, en ese orden (sin índice)."""
+    storm_ids = np.asarray(storm_ids, dtype=np.int64)
+    starts = store['offsets'][storm_ids]
+    lengths = store['offsets'][storm_ids + 1] - starts
+    offsets = np.zeros(len(storm_ids) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    pos = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+
+    sub = {k: store[k][pos] for k in POINT_FIELDS}
+    sub.update({k: store[k][storm_ids] for k in STORM_FIELDS})
+    sub['offsets'] = offsets
+    return sub
+
+def select_storms(store, storm_ids):
+    """Sub-almacén con los huracanes pedidos (con su propio índice y versión)."""
+    sub = _gather_storms(store, storm_ids)
+    sub['segments'] = build_segment_index(sub, store['segments']['cell_deg'])
+    sub['version'] = dataset_fingerprint(sub)
+    return sub
+
+def _same_storm(a, i, b, j):
+    """True si el huracán i de a y el j de b tienen la misma trayectoria y metadatos."""
+    sa, ea = a['offsets'][i], a['offsets'][i + 1]
+    sb, eb = b['offsets'][j], b['offsets'][j + 1]
+    if ea - sa != eb - sb or a['name'][i] != b['name'][j] or a['year'][i] != b['year'][j]:
+        return False
+    return all(np.array_equal(a[k][sa:ea], b[k][sb:eb]) for k in POINT_FIELDS)
+
+def update_track_store(store, df_supplement, removed_hids=()):
+    """
+    Actualización incremental con un archivo suplementario (p. ej. el Excel de la
+    temporada en curso): sus huracanes nuevos o modificados reemplazan a los del
+    almacén con el mismo HID; removed_hids se eliminan. El resto no se toca y el
+    índice espacial solo se expande para los huracanes actualizados.
+    El archivo suplementario es la fuente completa de sus HID.
+    Retorna (almacén nuevo, delta); delta es None si no hubo cambios, o un dict con
+    'from_version', 'to_version', 'old_to_new' (huracán viejo -> nuevo, -1 si se
+    reemplazó o eliminó) y 'updated' (ids nuevos de los huracanes actualizados).
+    """
+    sup = build_track_store(df_supplement)
+    n_old = n_storms(store)
+
+    changed = []
+    for j, hid in enumerate(sup['hid']):
+        i = int(np.searchsorted(store['hid'], hid))
+        if not (i < n_old and store['hid'][i] == hid and _same_storm(store, i, sup, j)):
+            changed.append(j)
+    changed = np.asarray(changed, dtype=np.int64)
+
+    dropped = np.isin(store['hid'], np.concatenate([sup['hid'][changed], np.asarray(list(removed_hids), dtype=object)]))
+    if len(changed) == 0 and not dropped.any():
+        return store, None
+    keep_old = np.flatnonzero(~dropped)
+
+    # Pool = almacén viejo seguido del suplementario; se toman los huracanes en orden de HID
+    pool = {k: np.concatenate([store[k], sup[k]]) for k in POINT_FIELDS + STORM_FIELDS}
+    pool['offsets'] = np.concatenate([store['offsets'], sup['offsets'][1:] + store['offsets'][-1]])
+    pool_ids = np.concatenate([keep_old, n_old + changed])
+    pool_ids = pool_ids[np.argsort(pool['hid'][pool_ids], kind='stable')]
+
+    new_store = _gather_storms(pool, pool_ids)
+    new_pos = np.empty(len(pool['hid']), dtype=np.int64)
+    new_pos[pool_ids] = np.arange(len(pool_ids))
+    old_to_new = np.full(n_old, -1, dtype=np.int64)
+    old_to_new[keep_old] = new_pos[keep_old]
+    updated = np.sort(new_pos[n_old + changed])
+
+    new_store['segments'] = update_segment_index(store['segments'], store['offsets'], new_store, old_to_new, updated)
+    new_store['version'] = dataset_fingerprint(new_store)
+    delta = {
+        'from_version': store['version'],
+        'to_version': new_store['version'],
+        'old_to_new': old_to_new,
+        'updated': updated,
+    }
+    return new_store, delta